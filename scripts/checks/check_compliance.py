@@ -9,11 +9,15 @@ compliance_checks package.
 
 import argparse
 import logging
+import multiprocessing
 import os
 import shlex
 import sys
+import tempfile
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
+from xml.sax.saxutils import quoteattr
 
 # ANSI color codes for colored output
 RED = '\033[0;31m'
@@ -25,8 +29,27 @@ CYAN = '\033[0;36m'
 BOLD = '\033[1m'
 NC = '\033[0m'  # No Color
 
-from compliance_checks import AVAILABLE_CHECKS, EndTest, git, init_globals, resolve_path_hint
-from junitparser import JUnitXml, TestSuite
+# Separator lines around each failed case in the summary
+HR = RED + "-" * 80
+HR_NC = HR + NC
+
+from compliance_checks import (
+    CHECK_INFO,
+    EndTest,
+    FmtdFailure,
+    available_cpus,
+    git,
+    init_globals,
+    load_check,
+    resolve_path_hint,
+)
+from junitparser import Error, Failure, Properties, Skipped, TestCase, TestSuite
+
+# Use the same ElementTree implementation as junitparser
+try:
+    from lxml import etree
+except ImportError:
+    from xml.etree import ElementTree as etree
 
 # Global variables (set by _main())
 WORKSPACE_BASE = None
@@ -70,6 +93,72 @@ def annotate(res):
     print(notice)
 
 
+def _xml_attrs(attrs):
+    """Format the dict 'attrs' as the attributes of an XML start tag."""
+    return "".join(f" {name}={quoteattr(value)}" for name, value in attrs.items())
+
+
+def write_junit(suite, output, suite_attrs=None):
+    """
+    Write 'suite' to 'output' in JUnit XML format.
+
+    'suite_attrs' are the attributes of the suite loaded from a previous run,
+    if any, which are kept along with its properties. The statistics are
+    recomputed.
+
+    Test cases are streamed to the file one at a time instead of serializing
+    the whole document in memory first.
+    """
+    tests = errors = failures = skipped = 0
+    time = 0
+    for case in suite:
+        tests += 1
+        if case.time is not None:
+            time += case.time
+        for entry in case.result:
+            if isinstance(entry, Failure):
+                failures += 1
+            elif isinstance(entry, Error):
+                errors += 1
+            elif isinstance(entry, Skipped):
+                skipped += 1
+
+    stats = {
+        "tests": str(tests),
+        "errors": str(errors),
+        "failures": str(failures),
+        "skipped": str(skipped),
+        "time": str(round(time, 3)),
+    }
+
+    with open(output, "wb") as f:
+        f.write(b'<?xml version="1.0" encoding="utf-8"?>\n')
+        f.write(f"<testsuites{_xml_attrs(stats)}>\n\t".encode())
+        f.write(f"<testsuite{_xml_attrs({**(suite_attrs or {}), 'name': suite.name, **stats})}>".encode())
+        properties = suite.child(Properties)
+        if properties is not None:
+            f.write(b"\n\t\t")
+            f.write(properties.tostring().strip())
+        for case in suite:
+            f.write(b"\n\t\t")
+            f.write(case.tostring())
+        f.write(b"\n\t</testsuite>\n</testsuites>\n")
+
+
+def load_first_suite(path):
+    """
+    Load the first test suite from the JUnit XML file 'path'. Returns it
+    along with its attributes, for write_junit().
+
+    The file is parsed incrementally and parsing stops at the end of the
+    first suite, so the rest of a large file is never read.
+    """
+    for _, elem in etree.iterparse(path, events=("end",)):
+        if elem.tag == "testsuite":
+            return TestSuite.fromelem(elem), dict(elem.attrib)
+    return TestSuite("Compliance"), {}
+
+
 def parse_args(argv):
     """Parse command line arguments."""
     default_range = "HEAD~1..HEAD"
@@ -153,6 +242,90 @@ def parse_args(argv):
     return args
 
 
+def _restore_env(saved_env):
+    """
+    Restore os.environ to 'saved_env'. Only the variables that differ are
+    touched, which usually means none at all.
+    """
+    for key in os.environ.keys() - saved_env.keys():
+        del os.environ[key]
+    for key, value in saved_env.items():
+        if os.environ.get(key) != value:
+            os.environ[key] = value
+
+
+def _run_one_check(testcase_class, args, mode, check_globals):
+    """
+    Run a single check in a worker process.
+
+    Returns the resulting TestCase as XML, the arguments of its formatted
+    failures, which the caller uses to build the suite and print annotations,
+    and everything the check wrote to stdout and stderr, so that the caller
+    prints it in one piece instead of interleaved with the other checks.
+
+    The TestCase and failures are not returned as such, as they cannot be
+    pickled when junitparser uses lxml.
+    """
+    with tempfile.TemporaryFile() as out:
+        # Redirecting the file descriptors catches the tools run by the check
+        # too. They are restored afterwards, for Python versions that reuse
+        # the worker process for another check.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        saved_fds = [os.dup(stream.fileno()) for stream in (sys.stdout, sys.stderr)]
+        os.dup2(out.fileno(), sys.stdout.fileno())
+        os.dup2(out.fileno(), sys.stderr.fileno())
+
+        try:
+            # Worker processes are spawned and share neither the
+            # orchestrator's globals nor its logging setup
+            init_globals(**check_globals)
+            if not logging.getLogger().handlers:
+                init_logs(args.loglevel)
+
+            case, fmtd_failures = _run_check(testcase_class, args, mode)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            for stream, fd in zip((sys.stdout, sys.stderr), saved_fds, strict=True):
+                os.dup2(fd, stream.fileno())
+                os.close(fd)
+
+        out.seek(0)
+        output = out.read().decode("utf-8", "replace")
+
+    fmtd_args = [(f.severity, f.title, f.file, f.line, f.col, f.desc, f.end_line, f.end_col) for f in fmtd_failures]
+    return case.tostring(), fmtd_args, output
+
+
+def _run_check(testcase_class, args, mode):
+    """Run a single check and return its TestCase and formatted failures."""
+    test = testcase_class()
+    test.global_args = args  # Pass global args to test instance
+
+    # Save environment before check to ensure isolation between checks
+    # Each check should be self-contained and not affect others
+    saved_env = dict(os.environ)
+
+    try:
+        # Each check will use what it needs
+        logging.info(f"Modo: {mode}")
+        test.run(
+            mode=mode,
+        )
+    except EndTest:
+        pass
+    except BaseException:
+        test.failure(f"An exception occurred in {test.name}:\n{traceback.format_exc()}")
+
+    finally:
+        # Restore environment after check to prevent pollution
+        _restore_env(saved_env)
+        logger.debug(f"Environment restored after {test.name}")
+
+    return test.case, test.fmtd_failures
+
+
 def _main(args):
     """The main function that orchestrates all checks."""
     # Initialize global variables
@@ -182,20 +355,21 @@ def _main(args):
         mode = "default"
         TARGET_PATHS = ["main_node", "secondary_node"]
 
-    init_globals(
-        git_top=GIT_TOP,
-        commit_range=COMMIT_RANGE,
-        target_paths=TARGET_PATHS,
-        workspace_base=WORKSPACE_BASE,
-        zephyr_base=ZEPHYR_BASE,
-    )
+    check_globals = {
+        "git_top": GIT_TOP,
+        "commit_range": COMMIT_RANGE,
+        "target_paths": TARGET_PATHS,
+        "workspace_base": WORKSPACE_BASE,
+        "zephyr_base": ZEPHYR_BASE,
+    }
+    init_globals(**check_globals)
     init_logs(args.loglevel)
 
     logger.info(f"Running tests in '{mode}' mode")
 
     if args.list:
-        for check_name in sorted(AVAILABLE_CHECKS.keys()):
-            print(AVAILABLE_CHECKS[check_name].name)
+        for check_name in sorted(CHECK_INFO.keys()):
+            print(CHECK_INFO[check_name].name)
         return 0
 
     # Load saved test results from an earlier run, if requested
@@ -205,68 +379,76 @@ def _main(args):
             return 1
 
         logging.info(f"Loading previous results from {args.previous_run}")
-        for loaded_suite in JUnitXml.fromfile(args.previous_run):
-            suite = loaded_suite
-            break
+        suite, suite_attrs = load_first_suite(args.previous_run)
     else:
-        suite = TestSuite("Compliance")
+        suite, suite_attrs = TestSuite("Compliance"), {}
 
-    included = list(map(lambda x: x.lower(), args.module))
-    excluded = list(map(lambda x: x.lower(), args.exclude_module))
+    included = frozenset(x.lower() for x in args.module)
+    excluded = frozenset(x.lower() for x in args.exclude_module)
 
-    # Get all available check classes
-    check_classes = AVAILABLE_CHECKS.values()
-
-    for testcase_class in check_classes:
-        # Filter checks based on include/exclude lists
-        if included and testcase_class.name.lower() not in included:
+    selected = []
+    for name, info in CHECK_INFO.items():
+        # Filter checks based on include/exclude lists, before anything is
+        # imported
+        if included and name not in included:
             continue
 
-        if testcase_class.name.lower() in excluded:
-            print(f"{ORANGE}Skipping {testcase_class.name}{NC}")
+        if name in excluded:
+            print(f"{ORANGE}Skipping {info.name}{NC}")
             continue
 
-        test = testcase_class()
-        test.global_args = args  # Pass global args to test instance
-
-        # Save environment before check to ensure isolation between checks
-        # Each check should be self-contained and not affect others
-        saved_env = os.environ.copy()
-
-        try:
-            print(f"{BLUE}Running {test.name:30}{NC} tests in {resolve_path_hint(test.path_hint)} ...")
-            # Each check will use what it needs
-            logging.info(f"Modo: {mode}")
-            test.run(
-                mode=mode,
-            )
-        except EndTest:
-            pass
-        except BaseException:
-            test.failure(f"An exception occurred in {test.name}:\n{traceback.format_exc()}")
-
-        finally:
-            # Restore environment after check to prevent pollution
-            os.environ.clear()
-            os.environ.update(saved_env)
-            logger.debug(f"Environment restored after {test.name}")
-
-        # Annotate if required
-        if args.annotate:
-            for res in test.fmtd_failures:
-                annotate(res)
-
-        suite.add_testcase(test.case)
+        selected.append(load_check(name))
+
+    # The checks are independent and mostly wait on external tools, so run
+    # them in parallel. Leave headroom when a check is multi-threaded itself,
+    # and split the CPUs between the checks so that the thread pools inside
+    # them do not oversubscribe the machine either.
+    cpus = available_cpus()
+    max_workers = max(1, min(len(selected), cpus))
+    if any(testcase_class.multithreaded for testcase_class in selected):
+        max_workers = max(1, min(max_workers, cpus // 2))
+    check_globals["cpus"] = max(1, cpus // max_workers)
+
+    # Each check gets a fresh process, so that state left behind by one (e.g.
+    # sys.path entries or pylint's astroid caches) cannot leak into the next.
+    # Python 3.10 has no max_tasks_per_child and reuses the spawned workers.
+    pool_args = {"max_workers": max_workers, "mp_context": multiprocessing.get_context("spawn")}
+    if sys.version_info >= (3, 11):
+        pool_args["max_tasks_per_child"] = 1
+    with ProcessPoolExecutor(**pool_args) as executor:
+        futures = [
+            executor.submit(_run_one_check, testcase_class, args, mode, check_globals) for testcase_class in selected
+        ]
+
+        # Collect in submission order so results and annotations are stable
+        for testcase_class, future in zip(selected, futures, strict=True):
+            try:
+                case_xml, fmtd_args, output = future.result()
+                case = TestCase.fromstring(case_xml)
+                fmtd_failures = [FmtdFailure(*args) for args in fmtd_args]
+            except BaseException:
+                # The worker itself died, report it against the check
+                test = testcase_class()
+                test.failure(f"An exception occurred in {test.name}:\n{traceback.format_exc()}")
+                case, fmtd_failures, output = test.case, test.fmtd_failures, ""
+
+            path = resolve_path_hint(testcase_class.path_hint)
+            print(f"{BLUE}Running {testcase_class.name:30}{NC} tests in {path} ...")
+            sys.stdout.write(output)
+            sys.stdout.flush()
+
+            # Annotate if required
+            if args.annotate:
+                for res in fmtd_failures:
+                    annotate(res)
+
+            suite.add_testcase(case)
 
     if args.output:
-        xml = JUnitXml()
-        xml.add_testsuite(suite)
-        xml.update_statistics()
-        xml.write(args.output, pretty=True)
+        write_junit(suite, args.output, suite_attrs)
 
     failed_cases = []
     warning_cases = []
-    name2doc = {testcase_class.name: testcase_class.doc for testcase_class in check_classes}
 
     for case in suite:
         if case.result:
@@ -289,10 +471,14 @@ def _main(args):
         if n_warnings:
             print(f"{YELLOW}{n_warnings} check(s) with warnings only{NC}")
 
+        case_outputs = {}
         for case in failed_cases + warning_cases:
-            print("", RED + "-" * 80, BOLD + case.name, RED + "-" * 80 + NC, sep="\n")
-            for res in case.result:
-                errmsg = res.text.strip()
+            # Flushed right away so the header stays above the log messages
+            # below, which go to stderr
+            sys.stdout.write(f"\n{HR}\n{BOLD}{case.name}\n{HR_NC}\n")
+            sys.stdout.flush()
+            errmsgs = [res.text.strip() for res in case.result]
+            for res, errmsg in zip(case.result, errmsgs, strict=True):
                 if res.type in ("error", "failure"):
                     logging.error(f"Test {case.name} failed: \n{errmsg}")
                 else:
@@ -300,12 +486,15 @@ def _main(args):
 
             if args.no_case_output:
                 continue
-            with open(f"{case.name}.txt", "w") as f:
-                docs = name2doc.get(case.name)
-                f.write(f"{docs}\n")
-                for res in case.result:
-                    errmsg = res.text.strip()
-                    f.write(f"\n {errmsg}")
+            # Cases loaded from a previous run may be for checks that were
+            # not selected this time
+            docs = load_check(case.name.lower()).doc if case.name.lower() in CHECK_INFO else None
+            # Keyed by file name, so the last case with a given name wins
+            case_outputs[f"{case.name}.txt"] = "".join([f"{docs}\n", *(f"\n {errmsg}" for errmsg in errmsgs)])
+
+        # The files are independent, overlap their writes with a small pool
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda item: Path(item[0]).write_text(item[1]), case_outputs.items()))
 
     if args.output:
         print(f"\nComplete results in {args.output}")
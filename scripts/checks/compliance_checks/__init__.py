@@ -4,60 +4,94 @@
 Compliance checks package.
 
 This package contains modular compliance checks for the zephyr-workspace project.
-Each check is implemented in its own module.
+Each check is implemented in its own module, which is only imported when the
+check is used.
 """
 
+import importlib
+from collections import namedtuple
+from collections.abc import Mapping
+
 # Export base classes
 from .base import ComplianceTest, EndTest, FmtdFailure
+from .utils import available_cpus, git, init_globals, resolve_path_hint
 
-# Import all check classes
-from .checkpatch import CheckPatch
-from .clang_format import ClangFormat
-from .cmake_style import CMakeStyle
-from .coccinelle import CoccinelleCheck
-from .codechecker import CodeChecker
-from .devicetree_bindings import DevicetreeBindingsCheck
-from .devicetree_linting import DevicetreeLintingCheck
-from .kconfig import KconfigCheck
-from .pylint import PyLint
-from .ruff import Ruff
-from .utils import git, init_globals, resolve_path_hint
-from .yaml_lint import YAMLLint
+# Where to find a check: its display name, module and class name
+CheckInfo = namedtuple("CheckInfo", ["name", "module", "cls"])
 
 # Registry of available checks
-# Maps check name (lowercase) to check class
-AVAILABLE_CHECKS = {
-    'clangformat': ClangFormat,
-    'checkpatch': CheckPatch,
-    'cmakestyle': CMakeStyle,
-    'devicetreebindings': DevicetreeBindingsCheck,
-    'yamllint': YAMLLint,
-    'kconfig': KconfigCheck,
-    'pylint': PyLint,
-    'ruff': Ruff,
-    'coccinelle': CoccinelleCheck,
-    'devicetreelinting': DevicetreeLintingCheck,
-    'codechecker': CodeChecker,
+# Maps check name (lowercase) to where the check class lives
+CHECK_INFO = {
+    'clangformat': CheckInfo('ClangFormat', '.clang_format', 'ClangFormat'),
+    'checkpatch': CheckInfo('Checkpatch', '.checkpatch', 'CheckPatch'),
+    'cmakestyle': CheckInfo('CMakeStyle', '.cmake_style', 'CMakeStyle'),
+    'devicetreebindings': CheckInfo('DevicetreeBindings', '.devicetree_bindings', 'DevicetreeBindingsCheck'),
+    'yamllint': CheckInfo('YAMLLint', '.yaml_lint', 'YAMLLint'),
+    'kconfig': CheckInfo('Kconfig', '.kconfig', 'KconfigCheck'),
+    'pylint': CheckInfo('Pylint', '.pylint', 'PyLint'),
+    'ruff': CheckInfo('Ruff', '.ruff', 'Ruff'),
+    'coccinelle': CheckInfo('Coccinelle', '.coccinelle', 'CoccinelleCheck'),
+    'devicetreelinting': CheckInfo('DevicetreeLinting', '.devicetree_linting', 'DevicetreeLintingCheck'),
+    'codechecker': CheckInfo('CodeChecker', '.codechecker', 'CodeChecker'),
 }
 
-# For backwards compatibility, also export by name
+# Check classes by class name, for the lazy attribute access below
+_CHECK_CLASSES = {info.cls: info for info in CHECK_INFO.values()}
+
+
+def load_check(name):
+    """
+    Import and return the check class registered as 'name' (lowercase) in
+    CHECK_INFO.
+    """
+    info = CHECK_INFO[name]
+    return getattr(importlib.import_module(info.module, __name__), info.cls)
+
+
+class _CheckClasses(Mapping):
+    """
+    Read-only mapping of check names (lowercase) to check classes, which only
+    imports a check when its class is looked up.
+    """
+
+    def __getitem__(self, name):
+        if name not in CHECK_INFO:
+            raise KeyError(name)
+        return load_check(name)
+
+    def __contains__(self, name):
+        return name in CHECK_INFO
+
+    def __iter__(self):
+        return iter(CHECK_INFO)
+
+    def __len__(self):
+        return len(CHECK_INFO)
+
+
+# Maps check name (lowercase) to check class
+AVAILABLE_CHECKS = _CheckClasses()
+
+
+def __getattr__(attr):
+    # Check classes can still be imported from the package by name
+    if attr in _CHECK_CLASSES:
+        return load_check(_CHECK_CLASSES[attr].name.lower())
+    raise AttributeError(f"module {__name__!r} has no attribute {attr!r}")
+
+
+# The check classes are left out, as they only exist once __getattr__() has
+# imported them. They can still be imported by name for backwards
+# compatibility.
 __all__ = [
     'AVAILABLE_CHECKS',
-    'CheckPatch',
-    'ClangFormat',
-    'CMakeStyle',
-    'CoccinelleCheck',
+    'CHECK_INFO',
     'ComplianceTest',
-    'DevicetreeBindingsCheck',
-    'DevicetreeLintingCheck',
-    'CodeChecker',
     'EndTest',
     'FmtdFailure',
-    'KconfigCheck',
-    'PyLint',
-    'Ruff',
-    'YAMLLint',
+    'available_cpus',
     'git',
     'init_globals',
+    'load_check',
     'resolve_path_hint',
 ]
@@ -69,9 +69,15 @@ class ComplianceTest:
       magic strings below:
       - "<zephyr-base>" can be used to refer to the environment variable
         ZEPHYR_BASE or, when missing, the calculated base of the zephyr tree.
+
+    multithreaded:
+      Set to True when the tools run by the test already use several CPUs
+      (e.g. pylint, clang-tidy). The orchestrator then runs fewer checks in
+      parallel to avoid oversubscribing the machine.
     """
 
     path_hint = "<git-top>"
+    multithreaded = False
 
     def __init__(self):
         self.case = TestCase(type(self).name, "Guidelines")
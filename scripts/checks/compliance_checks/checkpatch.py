@@ -7,10 +7,26 @@ Runs checkpatch.pl from Zephyr and reports found issues.
 
 import re
 import subprocess
+import tempfile
 
 from . import utils
 from .base import ComplianceTest
 
+# Extensions (without the dot) of the files checkpatch analyzes
+CEXTS = frozenset({'c', 'h', 'cpp', 'hpp', 'cc', 'S', 's', 'inc'})
+
+# A checkpatch issue is reported on two lines: the message, followed
+# (possibly after blank lines) by the location in the patched file
+ISSUE_RE = re.compile(r'^\s*\S+:(\d+):\s*(ERROR|WARNING):(.+?):(.+)')
+LOCATION_RE = re.compile(r'^\s*#(\d+):\s*FILE:\s*(.+):(\d+):')
+
+# Above this many issues, report the output as a single failure instead
+MAX_ISSUES = 500
+
+# Size above which the output kept for reporting unparsed failures is
+# spooled to a temporary file instead of memory
+OUTPUT_SPOOL_SIZE = 1024 * 1024
+
 
 class CheckPatch(ComplianceTest):
     """
@@ -37,12 +53,7 @@ class CheckPatch(ComplianceTest):
 
         if mode in ("path", "default"):
             # PATH/DEFAULT MODE: Analyze files directly
-            exts = ('.c', '.h', '.cpp', '.hpp', '.cc', '.S', '.s', '.inc')
-            files = []
-
-            for f in utils.files_from_paths():
-                if f.endswith(exts):
-                    files.append(f)
+            files = utils.files_with_ext(CEXTS)
 
             if not files:
                 return
@@ -56,45 +67,76 @@ class CheckPatch(ComplianceTest):
                     stderr=subprocess.STDOUT,
                     shell=False,
                     cwd=utils.GIT_TOP,
+                    text=True,
+                    errors="replace",
                 )
             except subprocess.CalledProcessError as ex:
-                output = ex.output.decode("utf-8", errors="replace")
-                self.failure(output)
+                self.failure(ex.output)
             return
 
         # DIFF MODE: Use git diff
         cmd = cmd_base + ['--mailback', '--no-tree', '-']
-        with subprocess.Popen(
-            ('git', 'diff', '--no-ext-diff', utils.COMMIT_RANGE), stdout=subprocess.PIPE, cwd=utils.GIT_TOP
-        ) as diff:
-            try:
-                subprocess.run(
-                    cmd,
-                    check=True,
-                    stdin=diff.stdout,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    shell=False,
-                    cwd=utils.GIT_TOP,
-                )
-            except subprocess.CalledProcessError as ex:
-                output = ex.output.decode("utf-8", errors="replace")
-                regex = (
-                    r'^\s*\S+:(\d+):\s*(ERROR|WARNING):(.+?):(.+)(?:\n|\r\n?)+'
-                    r'^\s*#(\d+):\s*FILE:\s*(.+):(\d+):'
-                )
+        with (
+            tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_SIZE, mode="w+", encoding="utf-8") as output,
+            subprocess.Popen(
+                ('git', 'diff', '--no-ext-diff', utils.COMMIT_RANGE), stdout=subprocess.PIPE, cwd=utils.GIT_TOP
+            ) as diff,
+            subprocess.Popen(
+                cmd,
+                stdin=diff.stdout,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                shell=False,
+                cwd=utils.GIT_TOP,
+                bufsize=1,
+                text=True,
+                errors="replace",
+            ) as proc,
+        ):
+            issues = self._parse_output(proc.stdout, output)
+            proc.wait()
+            if proc.returncode == 0:
+                return
+
+            # Add a guard here for excessive number of errors, do not try and
+            # process each one of them and instead push this as one failure.
+            # If nothing was parsed add the output as a failure too.
+            if not issues or len(issues) > MAX_ISSUES:
+                output.seek(0)
+                self.failure(output.read())
+                return
+
+        for issue in issues:
+            self.fmtd_failure(*issue)
+
+    def _parse_output(self, lines, output):
+        """
+        Parse checkpatch output as it is produced, copying it to the file
+        'output'.
+
+        Returns the list of fmtd_failure() arguments for the issues found,
+        which stops growing past MAX_ISSUES.
+        """
+        issues = []
+        pending = None
+
+        for line in lines:
+            output.write(line)
+            if len(issues) > MAX_ISSUES:
+                # Keep draining the pipe so that checkpatch can finish
+                continue
 
-                matches = re.findall(regex, output, re.MULTILINE)
+            m = ISSUE_RE.match(line)
+            if m:
+                pending = m
+                continue
 
-                # Add a guard here for excessive number of errors, do not try and
-                # process each one of them and instead push this as one failure.
-                if len(matches) > 500:
-                    self.failure(output)
-                    return
+            if pending is None or not line.strip():
+                continue
 
-                for m in matches:
-                    self.fmtd_failure(m[1].lower(), m[2], m[5], m[6], col=None, desc=m[3])
+            loc = LOCATION_RE.match(line)
+            if loc:
+                issues.append((pending[2].lower(), pending[3], loc[2], loc[3], None, pending[4]))
+            pending = None
 
-                # If the regex has not matched add the whole output as a failure
-                if len(matches) == 0:
-                    self.failure(output)
+        return issues
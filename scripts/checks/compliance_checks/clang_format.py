@@ -7,13 +7,24 @@ Checks if clang-format reports any formatting issues.
 
 import shutil
 import subprocess
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 import unidiff
 
 from . import utils
 from .base import ComplianceTest
 
+# Extensions (without the dot) of the files clang-format analyzes
+CEXTS = frozenset({"c", "h"})
+
+# Number of files passed to a single clang-format invocation
+BATCH_SIZE = 200
+
+
+def _has_c_ext(fname):
+    _, dot, ext = fname.rpartition(".")
+    return bool(dot) and ext in CEXTS
+
 
 class ClangFormat(ComplianceTest):
     """
@@ -27,9 +38,19 @@ class ClangFormat(ComplianceTest):
     def _process_patch_error(self, file: str, patch: unidiff.PatchedFile):
         """Process unidiff patch and report formatting issues."""
         for hunk in patch:
-            before = next(i for i, v in enumerate(hunk) if str(v).startswith(("-", "+")))
-            after = next(i for i, v in enumerate(reversed(hunk)) if str(v).startswith(("-", "+")))
-            msg = "".join([str(line) for line in hunk[before : -after or None]])
+            # Find the first and last changed lines in a single pass
+            first = last = None
+            for i, v in enumerate(hunk):
+                if v.line_type in ("-", "+"):
+                    if first is None:
+                        first = i
+                    last = i
+            after = len(hunk) - 1 - last
+            msg_parts = []
+            for line in hunk[first : last + 1]:
+                msg_parts.append(line.line_type)
+                msg_parts.append(line.value)
+            msg = "".join(msg_parts)
 
             self.fmtd_failure(
                 "notice",
@@ -46,8 +67,6 @@ class ClangFormat(ComplianceTest):
         Args:
             mode: Analysis mode - "path" (explicit paths), "diff" (git diff), or "default"
         """
-        exts = {".c", ".h"}
-
         if mode in ("path", "default"):
             # PATH/DEFAULT MODE: Analyze files directly using clang-format --dry-run
             clang_format = shutil.which("clang-format")
@@ -55,21 +74,30 @@ class ClangFormat(ComplianceTest):
                 self.skip("clang-format not found in PATH")
                 return
 
-            for f in utils.files_from_paths():
-                if Path(f).suffix not in exts:
-                    continue
+            cfiles = utils.files_with_ext(CEXTS)
+            batches = [cfiles[i : i + BATCH_SIZE] for i in range(0, len(cfiles), BATCH_SIZE)]
+
+            def check_batch(batch):
                 try:
                     subprocess.run(
-                        [clang_format, "--dry-run", "--Werror", "--style=file", f],
+                        [clang_format, "--dry-run", "--Werror", "--style=file", *batch],
                         check=True,
                         stdout=subprocess.PIPE,
                         stderr=subprocess.STDOUT,
                         shell=False,
                         cwd=utils.GIT_TOP,
+                        text=True,
+                        errors="replace",
                     )
                 except subprocess.CalledProcessError as ex:
-                    output = ex.output.decode("utf-8", errors="replace")
-                    self.failure(output)
+                    return ex.output
+                return None
+
+            # Threads only wait on the clang-format processes
+            with ThreadPoolExecutor(max_workers=utils.available_cpus()) as executor:
+                for output in executor.map(check_batch, batches):
+                    if output is not None:
+                        self.failure(output)
             return
         # DIFF MODE: Use clang-format-diff.py
         exe = shutil.which("clang-format-diff.py")
@@ -81,27 +109,39 @@ class ClangFormat(ComplianceTest):
             self.skip("No commit range specified for diff mode")
             return
 
-        for file in utils.get_files(filter="d"):
-            if Path(file).suffix not in exts:
-                continue
+        files = [f for f in utils.get_files(filter="d") if _has_c_ext(f)]
+        if not files:
+            return
 
-            diff = subprocess.Popen(
-                ("git", "diff", "-U0", "--no-color", "--no-ext-diff", utils.COMMIT_RANGE, "--", file),
+        # Feed the diff of all files to a single clang-format-diff.py run
+        diff = subprocess.Popen(
+            ("git", "diff", "-U0", "--no-color", "--no-ext-diff", utils.COMMIT_RANGE, "--", *files),
+            stdout=subprocess.PIPE,
+            cwd=utils.GIT_TOP,
+        )
+        try:
+            fmt = subprocess.run(
+                (exe, "-p1"),
+                stdin=diff.stdout,
                 stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                shell=False,
                 cwd=utils.GIT_TOP,
+                text=True,
+                errors="replace",
             )
-            try:
-                subprocess.run(
-                    (exe, "-p1"),
-                    check=True,
-                    stdin=diff.stdout,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.STDOUT,
-                    shell=False,
-                    cwd=utils.GIT_TOP,
-                )
-
-            except subprocess.CalledProcessError as ex:
-                patchset = unidiff.PatchSet.from_string(ex.output, encoding="utf-8")
-                for patch in patchset:
-                    self._process_patch_error(file, patch)
+        finally:
+            diff.stdout.close()
+            diff_status = diff.wait()
+
+        # An incomplete diff would silently pass the files it misses
+        if diff_status:
+            self.error(f"git diff {utils.COMMIT_RANGE} exited with status {diff_status}")
+
+        if fmt.returncode:
+            patchset = unidiff.PatchSet.from_string(fmt.stdout)
+            for patch in patchset:
+                # clang-format-diff.py names both sides after the file. Unlike
+                # patch.path, target_file is not stripped of a leading 'a/',
+                # 'i/', etc., which may well be a real directory.
+                self._process_patch_error(patch.target_file, patch)
@@ -10,6 +10,12 @@ import re
 from . import utils
 from .base import ComplianceTest
 
+# Both style rules in one pattern. Each group is optional, so a single
+# match tells which of the rules (if any) a line breaks:
+# - tab: tab indentation
+# - ifsp: space before the opening bracket of an if()
+STYLE_CHECK = re.compile(r"^(?P<tab>\t+)?(?:\s*(?P<ifsp>if\s+\())?")
+
 
 class CMakeStyle(ComplianceTest):
     """
@@ -30,7 +36,7 @@ class CMakeStyle(ComplianceTest):
         # Determine which files to check based on mode
         if mode in ("path", "default"):
             # PATH/DEFAULT MODE: Scan filesystem
-            files = utils.files_from_paths()
+            files = utils.files_with_ext(("cmake", "txt"))
         else:
             # DIFF MODE: Use git diff
             files = utils.get_files(filter="d")
@@ -42,14 +48,12 @@ class CMakeStyle(ComplianceTest):
 
     def check_style(self, fname):
         """Check style rules for a CMake file."""
-        SPACE_BEFORE_OPEN_BRACKETS_CHECK = re.compile(r"^\s*if\s+\(")
-        TAB_INDENTATION_CHECK = re.compile(r"^\t+")
-
         full_path = utils.GIT_TOP / fname
 
         with open(full_path, encoding="utf-8") as f:
-            for line_num, line in enumerate(f.readlines(), start=1):
-                if TAB_INDENTATION_CHECK.match(line):
+            for line_num, line in enumerate(f, start=1):
+                m = STYLE_CHECK.match(line)
+                if m["tab"] is not None:
                     self.fmtd_failure(
                         "error",
                         "CMakeStyle",
@@ -58,7 +62,7 @@ class CMakeStyle(ComplianceTest):
                         desc="Use spaces instead of tabs for indentation",
                     )
 
-                if SPACE_BEFORE_OPEN_BRACKETS_CHECK.match(line):
+                if m["ifsp"] is not None:
                     self.fmtd_failure(
                         "error",
                         "CMakeStyle",
@@ -5,9 +5,14 @@ Coccinelle compliance check.
 Runs Zephyr Coccinelle coding guideline checks on C/H files.
 """
 
+import functools
+import hashlib
 import logging
 import os
+import re
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from . import utils
@@ -16,6 +21,36 @@ from .base import ComplianceTest
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=8192)
+def _path_is_in_build_dir(path_str: str) -> bool:
+    """
+    Return True if the given file path lives under a build* directory.
+
+    That is, if any segment is equal to 'build' or starts with 'build_'
+    (e.g. build_xm126, build_boya_lora, etc.).
+    """
+    segments = path_str.replace("\\", "/").split("/")
+    return any(seg == "build" or seg.startswith("build_") for seg in segments)
+
+
+def _iter_source_files(root: str):
+    """Yield (path, stat) for the .c/.h files under root, skipping build directories."""
+    try:
+        it = os.scandir(root)
+    except OSError:
+        return
+
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                if not (entry.name == "build" or entry.name.startswith("build_")):
+                    yield from _iter_source_files(entry.path)
+            elif entry.name.endswith((".c", ".h")) and entry.is_file():
+                # coccicheck reports symlinked files by their target
+                path = os.path.realpath(entry.path) if entry.is_symlink() else entry.path
+                yield path, entry.stat()
+
+
 class CoccinelleCheck(ComplianceTest):
     """
     Runs Zephyr Coccinelle coding guideline checks on codebase.
@@ -24,6 +59,20 @@ class CoccinelleCheck(ComplianceTest):
     name = "Coccinelle"
     doc = "See https://docs.zephyrproject.org/latest/develop/coccinelle.html for more details"
     path_hint = "<git-top>"
+    multithreaded = True
+
+    # Report line format: filename:line:column: TYPE: message
+    _COCCI_LINE_RE = re.compile(
+        r"^(?P<file>[^:]+):(?P<line>\d+)(?::(?P<col>[^:]*))?:\s*(?P<sev>WARNING|ERROR):\s*(?P<msg>.*?)\s*$"
+    )
+
+    # Above this many changed files in a directory, coccicheck runs on the
+    # whole directory rather than on each file
+    _MAX_FILE_RUNS = 8
+
+    # function_names.pickle is generated at most once per process
+    _pickle_ready = False
+    _pickle_lock = threading.Lock()
 
     # Coccinelle rules to run in REPORT mode (must support --mode=report)
     REPORT_RULES = [
@@ -75,25 +124,23 @@ class CoccinelleCheck(ComplianceTest):
         if mode == "diff":
             # DIFF MODE: Analyze only modified C/H files from git diff
             logging.info("Coccinelle: analyzing modified files from git diff")
-            files = utils.get_files(filter="d")
-            c_files = [f for f in files if f.endswith(('.c', '.h'))]
 
-            # Extract unique top-level directories from modified files
+            # Extract unique top-level directories from modified C/H files
             # Coccinelle searches recursively, so we only need top-level dirs
             dirs_from_files = set()
-            for file in c_files:
-                file_path = Path(file)
+            for file in utils.get_files(filter="d"):
+                if not file.endswith(('.c', '.h')):
+                    continue
                 # Get top-level directory (e.g., "main_node" from "main_node/src/main.c")
-                if len(file_path.parts) > 0:
-                    top_dir = file_path.parts[0]
-                    # Skip if in IGNORE_PATH_PARTS
-                    if top_dir in utils.IGNORE_PATH_PARTS:
-                        logging.debug(f"Skipping file in excluded directory: {file}")
-                        continue
-                    # Add absolute path of top-level directory
-                    abs_dir = utils.GIT_TOP / top_dir
-                    if abs_dir.is_dir():
-                        dirs_from_files.add(str(abs_dir))
+                top_dir = file.split("/", 1)[0]
+                # Skip if in IGNORE_PATH_PARTS
+                if top_dir in utils.IGNORE_PATH_PARTS:
+                    logging.debug(f"Skipping file in excluded directory: {file}")
+                    continue
+                # Add absolute path of top-level directory
+                abs_dir = os.path.join(utils.GIT_TOP, top_dir)
+                if abs_dir not in dirs_from_files and os.path.isdir(abs_dir):
+                    dirs_from_files.add(abs_dir)
 
             target_dirs = sorted(dirs_from_files)
 
@@ -116,7 +163,8 @@ class CoccinelleCheck(ComplianceTest):
 
                 # If analyzing repository root (.), expand into subdirectories
                 if full == utils.GIT_TOP:
-                    logging.info(f"Expanding repository root into subdirectories (excluding {utils.IGNORE_PATH_PARTS})")
+                    excluded = ", ".join(sorted(utils.IGNORE_PATH_PARTS))
+                    logging.info(f"Expanding repository root into subdirectories (excluding {excluded})")
                     for subdir in full.iterdir():
                         if not subdir.is_dir():
                             continue
@@ -157,37 +205,208 @@ class CoccinelleCheck(ComplianceTest):
 
     def _run_report_mode(self, zephyr_root: Path, target_dirs: list[str], violations: list):
         """Run all REPORT_RULES in report mode over all target_dirs."""
+        # Hash every candidate file once, for all rules
+        digests = self._source_digests(target_dirs)
+        context = self._cache_context(zephyr_root, digests)
+
+        # Check which rules exist up front, and load their result caches
+        rules_dir = zephyr_root / "scripts" / "coccinelle"
+        caches = {}
+        work = []
         for rule in self.REPORT_RULES:
+            cocci_file = rules_dir / rule
+            try:
+                mtime = cocci_file.stat().st_mtime_ns
+            except OSError:
+                logging.warning(f"Skipping rule {rule} (file not found: {cocci_file})")
+                continue
+            caches[rule] = self._load_rule_cache(rule, mtime, context)
+
             # Only some rules need header analysis
             if rule in self.HEADER_REPORT_RULES:
                 sp_flags = ["--include-headers"]
             else:
                 sp_flags = None
 
-            for td in target_dirs:
-                # Run coccicheck on each directory separately to ensure correct behavior
-                _, rule_errors = self._run_coccinelle_rule(zephyr_root, rule, [td], sp_flags, violations)
+            work.append((rule, cocci_file, sp_flags))
+
+        if not work:
+            return
+
+        def run_one(item):
+            rule, cocci_file, sp_flags = item
+            cache = caches[rule][1]
+            rule_violations = []
+            rule_errors = False
+            new_entries = {}
+
+            # Reuse results for files whose contents haven't changed. coccicheck
+            # takes a single path, so run it on each directory with many
+            # changed files (covering all its files), or else on each changed
+            # file.
+            exts = (".c", ".h") if sp_flags is not None else (".c",)
+            for td, td_digests in digests.items():
+                files = {path: digest for path, digest in td_digests.items() if path.endswith(exts)}
+                misses = [path for path, digest in files.items() if digest not in cache]
+                if len(misses) > self._MAX_FILE_RUNS:
+                    runs = [(os.path.realpath(td), files)]
+                else:
+                    runs = [(path, {path: files[path]}) for path in misses]
+
+                covered = set()
+                for target, run_files in runs:
+                    fresh = []
+                    _, errors = self._run_coccinelle_rule(zephyr_root, rule, cocci_file, [target], sp_flags, fresh)
+                    rule_violations.extend(fresh)
+                    covered.update(run_files)
+
+                    # Don't cache anything from a run that failed
+                    if errors:
+                        rule_errors = True
+                        continue
+                    run_entries = dict.fromkeys(run_files.values(), ())
+                    for v in fresh:
+                        digest = run_files.get(v['file'])
+                        if digest is not None:
+                            run_entries[digest] += ((v['line'], v['severity'], v['message']),)
+                    new_entries.update(run_entries)
+
+                for path, digest in files.items():
+                    if path in covered:
+                        continue
+                    for line, severity, message in cache[digest]:
+                        rule_violations.append(
+                            {'file': path, 'line': line, 'severity': severity, 'message': message, 'rule': rule}
+                        )
+
+            # Cached and fresh results interleave, keep the report stable
+            rule_violations.sort(key=lambda v: v['file'])
+            return rule, rule_errors, rule_violations, new_entries
+
+        # Each rule is an independent coccicheck process, the threads only
+        # wait on them. Results are merged in order.
+        updated = set()
+        with ThreadPoolExecutor(max_workers=utils.available_cpus()) as executor:
+            for rule, rule_errors, rule_violations, new_entries in executor.map(run_one, work):
+                violations.extend(rule_violations)
+
+                if new_entries:
+                    caches[rule][1].update(new_entries)
+                    updated.add(rule)
 
                 if rule_errors:
                     self.failure(f"Coccinelle rule {rule} failed with internal errors")
 
+        for rule in updated:
+            self._save_rule_cache(*caches[rule], context)
+
+    def _cache_context(self, zephyr_root: Path, digests: dict) -> str:
+        """
+        Return a digest of what the results for a file depend on besides its
+        own contents: the headers it may include from the analyzed
+        directories, function_names.pickle and the Zephyr tree.
+        """
+        h = hashlib.sha256()
+        for td_digests in digests.values():
+            for path, digest in td_digests.items():
+                if path.endswith(".h"):
+                    h.update(f"{path}\0{digest}\0".encode())
+        h.update(str(utils.file_digest(zephyr_root / "function_names.pickle")).encode())
+        h.update(utils.git("rev-parse", "HEAD", cwd=zephyr_root, ignore_non_zero=True).encode())
+        return h.hexdigest()
+
+    def _load_rule_cache(self, rule: str, mtime: int, context: str):
+        """
+        Load the cached results of a rule.
+
+        Returns (cache_path, entries), where entries maps the sha256 of a
+        source file to the (line, severity, message) tuples the rule reported
+        for it. The rule file's mtime is part of the cache path, so editing
+        the rule invalidates its cache, and entries saved under another
+        context are dropped.
+        """
+        cache_path = utils.GIT_TOP / ".cache" / "coccinelle" / f"{rule}.{mtime}.json"
+        cache = utils.load_json_cache(cache_path)
+        if isinstance(cache, dict) and cache.get("context") == context and isinstance(cache.get("entries"), dict):
+            return cache_path, cache["entries"]
+        return cache_path, {}
+
+    def _save_rule_cache(self, cache_path: Path, entries: dict, context: str):
+        """Write back a rule cache, dropping caches for older rule versions."""
+        rule = cache_path.name.rsplit(".", 2)[0]
+        for stale in cache_path.parent.glob(f"{rule}.*.json"):
+            if stale != cache_path:
+                stale.unlink(missing_ok=True)
+
+        utils.save_json_cache(cache_path, {"context": context, "entries": entries})
+
+    def _source_digests(self, target_dirs: list[str]) -> dict[str, dict[str, str]]:
+        """
+        Return the sha256 of every .c/.h file under target_dirs, by path, by
+        target directory.
+
+        Digests are remembered along with the file's size and mtime, so only
+        new or modified files are read again.
+        """
+        index_path = utils.GIT_TOP / ".cache" / "coccinelle" / "digests.json"
+        index = utils.load_json_cache(index_path)
+        if not isinstance(index, dict):
+            index = {}
+
+        # Only the files seen in this walk are kept in the index
+        new_index = {}
+        digests = {}
+        for td in target_dirs:
+            if _path_is_in_build_dir(os.path.realpath(td)):
+                continue
+            td_digests = digests.setdefault(td, {})
+            for path, st in _iter_source_files(os.path.realpath(td)):
+                key = [st.st_size, st.st_mtime_ns]
+                known = index.get(path)
+                if isinstance(known, list) and len(known) == 2 and known[0] == key:
+                    td_digests[path] = known[1]
+                else:
+                    td_digests[path] = utils.file_digest(path)
+                if td_digests[path] is not None:
+                    new_index[path] = [key, td_digests[path]]
+
+        if new_index != index:
+            utils.save_json_cache(index_path, new_index)
+
+        return {td: dict(sorted(td_digests.items())) for td, td_digests in digests.items()}
+
     def _ensure_function_pickle(self, zephyr_root: Path):
         """
         Ensure function_names.pickle exists in zephyr_root.
 
         Some Zephyr coccinelle scripts expect function_names.pickle to be present
         in Zephyr tree root. We generate it once by running find_functions.cocci
-        with jobs=1 (as recommended upstream).
+        with jobs=1 (as recommended upstream), and again only if the rule is
+        newer than the pickle.
         """
-        pickle_path = zephyr_root / "function_names.pickle"
-        if pickle_path.exists():
+        if CoccinelleCheck._pickle_ready:
             return
 
-        logging.debug("Generating function_names.pickle for Coccinelle")
+        with CoccinelleCheck._pickle_lock:
+            if not CoccinelleCheck._pickle_ready:
+                self._generate_function_pickle(zephyr_root)
+                CoccinelleCheck._pickle_ready = True
 
+    def _generate_function_pickle(self, zephyr_root: Path):
+        """Run find_functions.cocci unless function_names.pickle is up to date."""
+        pickle_path = zephyr_root / "function_names.pickle"
         coccicheck = zephyr_root / "scripts" / "coccicheck"
         cocci_file = zephyr_root / "scripts" / "coccinelle" / "find_functions.cocci"
 
+        try:
+            if pickle_path.stat().st_mtime_ns >= cocci_file.stat().st_mtime_ns:
+                return
+        except FileNotFoundError:
+            if pickle_path.exists():
+                return
+
+        logging.debug("Generating function_names.pickle for Coccinelle")
+
         cmd = [
             str(coccicheck),
             "--mode=report",
@@ -219,6 +438,7 @@ class CoccinelleCheck(ComplianceTest):
         self,
         zephyr_root: Path,
         rule: str,
+        cocci_file: Path,
         target_dirs: list[str],
         extra_sp_flags: list[str] = None,
         violations_list: list = None,
@@ -231,15 +451,12 @@ class CoccinelleCheck(ComplianceTest):
           - had_errors = True  if coccicheck failed in an unexpected way
         """
         coccicheck = zephyr_root / "scripts" / "coccicheck"
-        cocci_file = zephyr_root / "scripts" / "coccinelle" / rule
-
-        if not cocci_file.is_file():
-            logging.warning(f"Skipping rule {rule} (file not found: {cocci_file})")
-            return False, False
 
+        # Parallelism comes from running several rules at once
         cmd = [
             str(coccicheck),
             "--mode=report",
+            "--jobs=1",
             f"--cocci={cocci_file}",
         ]
 
@@ -250,85 +467,50 @@ class CoccinelleCheck(ComplianceTest):
 
         cmd.extend(target_dirs)
 
-        logging.debug(f"Running: {' '.join(cmd)}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Running: {' '.join(cmd)}")
 
-        # Run command silently (capture output)
-        result = subprocess.run(
+        # Parse output for violations as coccicheck produces it
+        had_issues = False
+        had_errors = False
+
+        with subprocess.Popen(
             cmd,
             cwd=zephyr_root,
             text=True,
+            bufsize=1,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-        )
-
-        raw_output = result.stdout or ""
-
-        # Parse output for violations
-        had_issues = False
-        had_errors = False
-
-        for line in raw_output.splitlines():
-            if "WARNING:" in line or "ERROR:" in line:
-                stripped = line.lstrip()
-                path_part = stripped.split(":", 1)[0]
-
-                if self._path_is_in_build_dir(path_part):
-                    continue  # Skip build directories
-
-                had_issues = True
-                # Store violation for JUnit reporting
-                if violations_list is not None:
-                    try:
-                        # Parse line format: filename:line:column: TYPE: message
-                        parts = stripped.split(":", 4)
-                        if len(parts) >= 3:
-                            filename = parts[0]
-                            line_num = parts[1]
-                            rest = ":".join(parts[2:])
-
-                            # Extract type and message
-                            if "ERROR:" in rest:
-                                severity = "error"
-                                message = rest.split("ERROR:", 1)[1].strip()
-                            elif "WARNING:" in rest:
-                                severity = "warning"
-                                message = rest.split("WARNING:", 1)[1].strip()
-                            else:
-                                severity = "warning"
-                                message = rest.strip()
-
-                            # Convert path relative to zephyr_root to absolute path
-                            abs_path = (zephyr_root / filename).resolve()
-                            violations_list.append(
-                                {
-                                    'file': str(abs_path),
-                                    'line': line_num,
-                                    'severity': severity,
-                                    'message': message,
-                                    'rule': rule,
-                                }
-                            )
-                    except Exception:
-                        pass  # Skip parsing errors
-
-            if "Invalid mode" in line:
-                had_errors = True
+        ) as proc:
+            for line in proc.stdout:
+                if "WARNING:" in line or "ERROR:" in line:
+                    stripped = line.lstrip()
+                    path_part = stripped.split(":", 1)[0]
+
+                    if _path_is_in_build_dir(path_part):
+                        continue  # Skip build directories
+
+                    had_issues = True
+                    # Store violation for JUnit reporting
+                    m = self._COCCI_LINE_RE.match(stripped)
+                    if violations_list is not None and m:
+                        # Convert path relative to zephyr_root to absolute path
+                        abs_path = os.path.normpath(os.path.join(zephyr_root, m["file"]))
+                        violations_list.append(
+                            {
+                                'file': abs_path,
+                                'line': m["line"],
+                                'severity': m["sev"].lower(),
+                                'message': m["msg"],
+                                'rule': rule,
+                            }
+                        )
+
+                if "Invalid mode" in line:
+                    had_errors = True
 
         # coccicheck convention: 0 = no matches, 1 = matches found, >1 = internal error
-        if result.returncode not in (0, 1):
+        if proc.returncode not in (0, 1):
             had_errors = True
 
         return had_issues, had_errors
-
-    def _path_is_in_build_dir(self, path_str: str) -> bool:
-        """
-        Return True if the given file path lives under a build* directory.
-
-        We normalize the path and then look for any segment equal to 'build'
-        or starting with 'build_' (e.g. build_xm126, build_boya_lora, etc.).
-        """
-        cleaned = path_str.lstrip("./").lstrip(".\\")
-        cleaned = os.path.normpath(cleaned)
-        segments = cleaned.split(os.sep)
-
-        return any(seg == "build" or seg.startswith("build_") for seg in segments)
@@ -4,42 +4,78 @@
 CodeChecker compliance check.
 """
 
+import functools
+import hashlib
 import logging
+import mmap
+import os
 import re
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from . import utils
 from .base import ComplianceTest
 
 
+@functools.cache
+def _resolved(path: Path) -> str:
+    return str(path.resolve())
+
+
+@functools.lru_cache(maxsize=4096)
+def _repo_rel(git_top: Path, p: str) -> str:
+    """Return p, absolute or relative to git_top, relative to git_top."""
+    try:
+        # Plain paths don't need resolve() and its stat() calls
+        if ".." not in p.split(os.sep):
+            if not os.path.isabs(p):
+                return Path(os.path.normpath(p)).as_posix()
+            top = _resolved(git_top) + os.sep
+            if p.startswith(top):
+                return Path(p[len(top) :]).as_posix()
+
+        pp = Path(p)
+        if not pp.is_absolute():
+            pp = git_top / pp
+        return pp.resolve().relative_to(_resolved(git_top)).as_posix()
+    except Exception:
+        return str(p).replace("\\", "/")
+
+
 class CodeChecker(ComplianceTest):
     name = "CodeChecker"
     doc = ""
     path_hint = "<git-top>"
+    multithreaded = True
 
     STATUS_OK = "ok"
     STATUS_FAIL = "fail"
     STATUS_ERROR = "error"
 
     _ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")
+    # str.translate() table deleting the code points XML 1.0 doesn't allow
+    _XML_INVALID = dict.fromkeys(
+        [*(cp for cp in range(0x20) if cp not in (0x09, 0x0A, 0x0D)), *range(0xD800, 0xE000), 0xFFFE, 0xFFFF]
+    )
+    _ANSI_BYTES_RE = re.compile(rb"\x1B\[[0-?]*[ -/]*[@-~]")
+    # Matches issue header lines anywhere in the (ANSI-stripped) parse log
     _CC_ISSUE_RE = re.compile(
-        r"^\[(?P<sev>[A-Z]+)\]\s+"
-        r"(?P<file>[^:]+):(?P<line>\d+):(?P<col>\d+):\s+"
-        r"(?P<msg>.+?)\s+\[(?P<checker>[^\]]+)\]\s*$"
+        rb"^[ \t]*\[(?P<sev>[A-Z]+)\][ \t]+"
+        rb"(?P<file>[^:\n]+):(?P<line>\d+):(?P<col>\d+):[ \t]+"
+        rb"(?P<msg>.+?)[ \t]+\[(?P<checker>[^\]\n]+)\][ \t\r]*$",
+        re.MULTILINE,
     )
+    # Lines that end the context following an issue header
+    _CC_CTX_STOP_RE = re.compile(rb"----====|\[INFO")
+    # App files that feed the CMake configure step
+    _BUILD_INPUT_RE = re.compile(r"CMakeLists\.txt|.*\.cmake|prj\.conf|Kconfig.*|.*\.overlay|.*\.dts.*")
 
     def _sanitize_for_xml(self, s: str) -> str:
         if not s:
             return ""
-        s = self._ANSI_RE.sub("", s)
-        out = []
-        for ch in s:
-            o = ord(ch)
-            if ch in ("\t", "\n", "\r") or 0x20 <= o <= 0xD7FF or 0xE000 <= o <= 0xFFFD or 0x10000 <= o <= 0x10FFFF:
-                out.append(ch)
-        return "".join(out)
+        return self._ANSI_RE.sub("", s).translate(self._XML_INVALID)
 
     def _map_cc_severity(self, sev: str) -> str:
         s = (sev or "").strip().upper()
@@ -50,85 +86,80 @@ class CodeChecker(ComplianceTest):
         # LOW / STYLE / anything else
         return "notice"
 
-    def _extract_cc_issues(self, out: str) -> list[dict]:
+    def _extract_cc_issues(self, log_path: Path) -> list[dict]:
+        """Parse the issues out of a CodeChecker parse log."""
         issues: list[dict] = []
-        if not out:
-            return issues
-
-        out = self._ANSI_RE.sub("", out)
-
-        lines = out.splitlines()
-        i = 0
-        while i < len(lines):
-            m = self._CC_ISSUE_RE.match(lines[i].strip())
-            if not m:
-                i += 1
-                continue
 
-            sev = self._map_cc_severity(m.group("sev"))
-            fpath = m.group("file").strip()
-            line = int(m.group("line"))
-            col = int(m.group("col"))
-            msg = m.group("msg").rstrip()
-            checker = m.group("checker").strip()
-
-            ctx = []
-            j = i + 1
-            while j < len(lines) and len(ctx) < 2:
-                nxt = lines[j].rstrip("\n")
-                if not nxt.strip():
-                    break
-                if self._CC_ISSUE_RE.match(nxt.strip()):
-                    break
-                if nxt.startswith("----====") or nxt.startswith("[INFO"):
-                    break
-                ctx.append(nxt)
-                j += 1
-
-            if ctx:
-                msg = msg + "\r\n" + "\r\n".join(ctx)
-
-            try:
-                p = Path(fpath)
-                if not p.is_absolute():
-                    p = utils.GIT_TOP / p
-                fpath = p.relative_to(utils.GIT_TOP).as_posix()
-                if fpath.startswith("./"):
-                    fpath = fpath[2:]
-            except Exception:
-                pass
-
-            issues.append(
-                {
-                    "severity": sev,
-                    "file": fpath,
-                    "line": line,
-                    "col": col,
-                    "checker": checker,
-                    "msg": msg,
-                }
-            )
+        with open(log_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return issues
 
-            i = j
+            # Scan the log in place, only copying it if it has colors to strip
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                out = self._ANSI_BYTES_RE.sub(b"", mm) if mm.find(b"\x1b") != -1 else mm
+                for m in self._CC_ISSUE_RE.finditer(out):
+                    issues.append(self._cc_issue(out, m))
 
         return issues
 
+    def _cc_issue(self, out: bytes, m: re.Match) -> dict:
+        """Build an issue from a header match, along with its context lines."""
+        sev = self._map_cc_severity(m.group("sev").decode())
+        fpath = m.group("file").decode(errors="replace").strip()
+        line = int(m.group("line"))
+        col = int(m.group("col"))
+        msg = m.group("msg").decode(errors="replace").rstrip()
+        checker = m.group("checker").decode(errors="replace").strip()
+
+        # Up to two context lines follow the header
+        ctx = []
+        pos = m.end() + 1
+        while pos < len(out) and len(ctx) < 2:
+            end = out.find(b"\n", pos)
+            if end == -1:
+                end = len(out)
+            nxt = out[pos:end].rstrip(b"\r")
+            if not nxt.strip() or self._CC_ISSUE_RE.match(nxt) or self._CC_CTX_STOP_RE.match(nxt):
+                break
+            ctx.append(nxt.decode(errors="replace"))
+            pos = end + 1
+
+        if ctx:
+            msg = msg + "\r\n" + "\r\n".join(ctx)
+
+        # Make the path relative to the repository, if it's inside it
+        if os.path.isabs(fpath):
+            top = f"{utils.GIT_TOP}{os.sep}"
+            if fpath.startswith(top):
+                fpath = fpath[len(top) :]
+        elif fpath.startswith("./"):
+            fpath = fpath[2:]
+
+        return {
+            "severity": sev,
+            "file": fpath,
+            "line": line,
+            "col": col,
+            "checker": checker,
+            "msg": msg,
+        }
+
     def _board_for_app(self, app: Path) -> str:
         if "secondary_node" in app.parts:
             return "adafruit_feather_m0_lora"
         return "qemu_cortex_m3"
 
-    def _analyze_app(self, app: Path, only_files: list[str] | None = None) -> tuple[str, str]:
-        board = self._board_for_app(app)
-
+    def _build_app(self, app: Path, board: str, build_dir: Path, pristine: bool) -> tuple[str, str] | None:
+        """
+        Configure app in build_dir, from scratch if pristine is True, and
+        generate its headers. Returns an error result if configuring fails.
+        """
         rel = app.relative_to(utils.GIT_TOP)
-        build_dir = utils.GIT_TOP / "buildsca" / str(rel) / board
 
-        if build_dir.exists():
+        if pristine and build_dir.exists():
             shutil.rmtree(build_dir)
         build_dir.mkdir(parents=True, exist_ok=True)
 
-        # 1) west build
         west_cmd = [
             "west",
             "build",
@@ -137,8 +168,6 @@ class CodeChecker(ComplianceTest):
             "-d",
             str(build_dir),
             str(app),
-            "-p",
-            "always",
             "--cmake-only",
             "--",
             "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON",
@@ -151,11 +180,18 @@ class CodeChecker(ComplianceTest):
             text=True,
             errors="replace",
         )
+
+        # A compile_commands.json left over by an earlier build does not make
+        # up for a failed one
         if r.returncode != 0:
             return (self.STATUS_ERROR, f"west build failed for {rel}\n{r.stdout}")
+        if not (build_dir / "compile_commands.json").is_file():
+            return (self.STATUS_ERROR, f"Missing compile_commands.json for {rel}")
 
+        # The generated headers are only needed to resolve some includes, so
+        # the analysis goes ahead without them
         gen_cmd = ["west", "build", "-d", str(build_dir), "-t", "zephyr_generated_headers"]
-        r2 = subprocess.run(
+        r = subprocess.run(
             gen_cmd,
             cwd=utils.GIT_TOP,
             stdout=subprocess.PIPE,
@@ -163,16 +199,47 @@ class CodeChecker(ComplianceTest):
             text=True,
             errors="replace",
         )
-        if r2.returncode != 0:
-            pass
+        if r.returncode != 0:
+            logging.getLogger(self.name).warning(f"Generating the headers of {rel} failed:\n{r.stdout}")
+
+        return None
+
+    def _analyze_app(self, app: Path, only_files: list[str] | None = None) -> tuple[str, str | Path]:
+        """
+        Build and analyze app.
+
+        Returns (status, out). On STATUS_FAIL, out is the path of the
+        CodeChecker parse log holding the reports, otherwise it's a message.
+        """
+        board = self._board_for_app(app)
+
+        rel = app.relative_to(utils.GIT_TOP)
+        build_dir = utils.GIT_TOP / "buildsca" / str(rel) / board
 
         compile_db = build_dir / "compile_commands.json"
-        if not compile_db.is_file():
-            return (self.STATUS_ERROR, f"Missing compile_commands.json for {rel}")
+        build_key_file = build_dir / ".build_key"
+
+        # The sources are globbed by CMake, so adding or removing one needs a
+        # new configure step too, and so does another Zephyr revision
+        west_yml = utils.GIT_TOP / "west.yml"
+        zephyr_head = ""
+        if os.path.isdir(utils.ZEPHYR_BASE):
+            zephyr_head = utils.git("rev-parse", "HEAD", cwd=utils.ZEPHYR_BASE, ignore_non_zero=True)
+        build_key = self._tree_key(app, [board, self._stat_key(west_yml), zephyr_head], self._BUILD_INPUT_RE)
+
+        # 1) west build, unless none of its inputs changed since the last one.
+        # Start over only if they did, otherwise an incremental build finishes
+        # an incomplete one.
+        old_build_key = self._read_key(build_key_file)
+        if not compile_db.is_file() or old_build_key != build_key:
+            st = self._build_app(app, board, build_dir, pristine=old_build_key != build_key)
+            if st is not None:
+                return st
+            build_key_file.write_text(build_key)
 
         # 2) CodeChecker analyze
         reports_dir = build_dir / "reports"
-        reports_dir.mkdir(parents=True, exist_ok=True)
+        analyze_key_file = build_dir / ".analyze_key"
 
         app_rel = rel.as_posix()
 
@@ -203,16 +270,31 @@ class CodeChecker(ComplianceTest):
             "clang-diagnostic-reserved-macro-identifier",
         ]
 
-        r = subprocess.run(
-            analyze_cmd,
-            cwd=utils.GIT_TOP,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            errors="replace",
+        # Skip the analysis if neither the sources nor the compile commands
+        # changed since the reports were produced
+        analyze_key = self._tree_key(
+            app,
+            [compile_db.read_text(errors="replace"), self._stat_key(skip_file), *analyze_cmd],
         )
-        if r.returncode != 0:
-            return (self.STATUS_ERROR, f"CodeChecker analyze error for {rel}\n{r.stdout}")
+
+        if not reports_dir.is_dir() or self._read_key(analyze_key_file) != analyze_key:
+            analyze_key_file.unlink(missing_ok=True)
+            if reports_dir.exists():
+                shutil.rmtree(reports_dir)
+            reports_dir.mkdir(parents=True, exist_ok=True)
+
+            r = subprocess.run(
+                analyze_cmd,
+                cwd=utils.GIT_TOP,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                errors="replace",
+            )
+            if r.returncode != 0:
+                return (self.STATUS_ERROR, f"CodeChecker analyze error for {rel}\n{r.stdout}")
+
+            analyze_key_file.write_text(analyze_key)
 
         # 3) CodeChecker parse
         parse_cmd = [
@@ -227,34 +309,83 @@ class CodeChecker(ComplianceTest):
         if skip_file.is_file():
             parse_cmd += ["-i", str(skip_file)]
 
-        r = subprocess.run(
-            parse_cmd,
-            cwd=utils.GIT_TOP,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            errors="replace",
-        )
+        # The reports can be large: keep them on disk, they are parsed from
+        # there (see _extract_cc_issues())
+        parse_log = build_dir / "parse.log"
+        with open(parse_log, "wb") as log:
+            r = subprocess.run(
+                parse_cmd,
+                cwd=utils.GIT_TOP,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+            )
 
         if r.returncode == 0:
             return (self.STATUS_OK, "")
 
         if r.returncode == 2:
-            return (self.STATUS_FAIL, f"CodeChecker reports for {rel}\n{r.stdout}")
+            return (self.STATUS_FAIL, parse_log)
 
-        return (self.STATUS_ERROR, f"CodeChecker parse error for {rel}\n{r.stdout}")
+        return (self.STATUS_ERROR, f"CodeChecker parse error for {rel}\n{parse_log.read_text(errors='replace')}")
 
-    def _normalize_repo_rel(self, p: str) -> str:
+    @staticmethod
+    def _read_key(path: Path) -> str | None:
+        try:
+            return path.read_text()
+        except OSError:
+            return None
+
+    @staticmethod
+    def _stat_key(path: Path) -> str:
         try:
-            pp = Path(p)
-            if not pp.is_absolute():
-                pp = utils.GIT_TOP / pp
-            pp = pp.resolve()
-            return pp.relative_to(utils.GIT_TOP.resolve()).as_posix()
-        except Exception:
-            return str(p).replace("\\", "/")
-
-    def _finalize_results(self, results: list[tuple[Path, str, str, list[str] | None]]) -> None:
+            st = path.stat()
+        except OSError:
+            return f"{path}:-"
+        return f"{path}:{st.st_mtime_ns}:{st.st_size}"
+
+    def _tree_key(self, root: Path, extra: list[str], match: re.Pattern | None = None) -> str:
+        """
+        Hash extra together with the size and mtime of the files under root.
+        If match is given, only the files whose name fully matches it are
+        hashed that way, and only the paths of the others.
+        """
+        h = hashlib.sha256()
+        for item in extra:
+            h.update(item.encode())
+            h.update(b"\0")
+
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(d for d in dirnames if d not in utils.IGNORE_PATH_PARTS and not d.startswith("build_"))
+            for name in sorted(filenames):
+                if match is None or match.fullmatch(name):
+                    h.update(self._stat_key(Path(dirpath, name)).encode())
+                else:
+                    h.update(os.path.join(dirpath, name).encode())
+                h.update(b"\0")
+
+        return h.hexdigest()
+
+    def _analyze_apps(self, apps: dict[Path, list[str] | None]) -> list[tuple[Path, str, str | Path, list[str] | None]]:
+        """
+        Analyze apps concurrently, each one in its own build directory.
+
+        apps maps each app root to the files to report on, or None for all of
+        them. Results are returned in sorted app order.
+        """
+        log = logging.getLogger(self.name)
+
+        def analyze(app):
+            log.info("Analyzing app: %s", app.relative_to(utils.GIT_TOP))
+            st, out = self._analyze_app(app, apps[app])
+            return (app, st, out, apps[app])
+
+        with ThreadPoolExecutor(max_workers=min(len(apps), utils.available_cpus())) as executor:
+            return list(executor.map(analyze, sorted(apps)))
+
+    def _normalize_repo_rel(self, p: str) -> str:
+        return _repo_rel(utils.GIT_TOP, str(p))
+
+    def _finalize_results(self, results: list[tuple[Path, str, str | Path, list[str] | None]]) -> None:
         errors = []
         fails = []
 
@@ -279,7 +410,8 @@ class CodeChecker(ComplianceTest):
                 raw_issues = self._extract_cc_issues(out)
 
                 if not raw_issues:
-                    parsing_failed.append((app, out))
+                    rel = app.relative_to(utils.GIT_TOP)
+                    parsing_failed.append((app, f"CodeChecker reports for {rel}\n{out.read_text(errors='replace')}"))
                     continue
 
                 issues = raw_issues
@@ -294,7 +426,7 @@ class CodeChecker(ComplianceTest):
                         f"{app_rel}/src/",
                         f"{app_rel}/include/",
                     )
-                    issues = [it for it in issues if any(it.get("file", "").startswith(p) for p in keep_prefixes)]
+                    issues = [it for it in issues if it.get("file", "").startswith(keep_prefixes)]
 
                 if not issues:
                     continue
@@ -351,12 +483,7 @@ class CodeChecker(ComplianceTest):
             for a in unique_apps:
                 log.info("  - %s", a.relative_to(utils.GIT_TOP))
 
-            results = []
-            for app in unique_apps:
-                log.info("Analyzing app: %s", app.relative_to(utils.GIT_TOP))
-                st, out = self._analyze_app(app)
-                results.append((app, st, out, None))
-
+            results = self._analyze_apps(dict.fromkeys(unique_apps))
             self._finalize_results(results)
             return
 
@@ -403,17 +530,7 @@ class CodeChecker(ComplianceTest):
                 self.skip("No Zephyr apps found for listed files")
                 return
 
-            results = []
-            for app in sorted(apps.keys()):
-                log.info("Analyzing app: %s", app.relative_to(utils.GIT_TOP))
-                only_files = apps[app]
-                if only_files is None:
-                    st, out = self._analyze_app(app)
-                else:
-                    st, out = self._analyze_app(app, only_files)
-
-                results.append((app, st, out, only_files))
-
+            results = self._analyze_apps(apps)
             self._finalize_results(results)
             return
 
@@ -453,12 +570,7 @@ class CodeChecker(ComplianceTest):
             self.skip("No Zephyr apps found for listed files")
             return
 
-        results = []
-        for app in sorted(apps.keys()):
-            log.info("Analyzing app: %s", app.relative_to(utils.GIT_TOP))
-            st, out = self._analyze_app(app, apps[app])
-            results.append((app, st, out, apps[app]))
-
+        results = self._analyze_apps(apps)
         self._finalize_results(results)
 
         return
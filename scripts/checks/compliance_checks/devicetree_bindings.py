@@ -5,15 +5,142 @@ DevicetreeBindings compliance check.
 Checks if we are introducing any unwanted properties in Devicetree Bindings.
 """
 
+import functools
+import logging
 import os
-import subprocess
+import re
 import sys
-from glob import glob
-from pathlib import Path
 
 from . import utils
 from .base import ComplianceTest
 
+try:
+    import yaml
+
+    # libyaml-backed loader, when PyYAML was built with it
+    _YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+except ImportError:
+    yaml = None
+
+
+# Binding YAMLs are the .yaml files under a dts/bindings/ directory. Either
+# separator is accepted, so Windows paths need no normalization first.
+_BINDING_YAML_RE = re.compile(r"(?:^|[/\\])dts[/\\]bindings[/\\].*\.yaml\Z", re.DOTALL)
+
+
+def _iter_yaml(root, dir_mtimes=None):
+    """
+    Yield the paths of the .yaml files under root, recursively and in sorted
+    order. Hidden entries and directories in IGNORE_PATH_PARTS are skipped.
+
+    If dir_mtimes is a dict, the mtime of every directory walked is stored in
+    it.
+    """
+    stack = [os.fspath(root)]
+    while stack:
+        top = stack.pop()
+        try:
+            if dir_mtimes is not None:
+                # before listing, so a concurrent change shows up next time
+                dir_mtimes[top] = os.stat(top).st_mtime_ns
+            with os.scandir(top) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            continue
+
+        subdirs = []
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in utils.IGNORE_PATH_PARTS:
+                    subdirs.append(entry.path)
+            elif entry.name.endswith(".yaml") and entry.is_file(follow_symlinks=False):
+                yield entry.path
+
+        # Depth-first, in name order
+        stack.extend(reversed(subdirs))
+
+
+def _support_yamls(root):
+    """
+    Return list(_iter_yaml(root)), using an index cached in .cache/devicetree/.
+    The index is JSON, as the work tree may come from an untrusted pull
+    request.
+
+    Adding, removing or renaming a file changes the mtime of its directory, so
+    the index stays valid as long as none of the walked directories changed,
+    which takes a stat() per directory instead of listing all of them.
+    """
+    root = os.fspath(root)
+    index_path = utils.GIT_TOP / ".cache" / "devicetree" / "support_yamls.json"
+
+    index = utils.load_json_cache(index_path)
+    try:
+        if index["root"] == root and all(os.stat(path).st_mtime_ns == mtime for path, mtime in index["dirs"].items()):
+            return index["yamls"]
+    except Exception as e:
+        logging.debug(f"Ignoring stale or unreadable bindings index {index_path}: {e}")
+
+    dir_mtimes = {}
+    yamls = list(_iter_yaml(root, dir_mtimes))
+
+    utils.save_json_cache(index_path, {"root": root, "dirs": dir_mtimes, "yamls": yamls})
+
+    return yamls
+
+
+def _may_fail(raw):
+    """
+    Return True if raw binding data has a property name with underscores or a
+    'required: false', i.e. something the checks could flag.
+    """
+    while isinstance(raw, dict):
+        props = raw.get("properties")
+        if isinstance(props, dict):
+            for name, prop in props.items():
+                if "_" in str(name) or (isinstance(prop, dict) and prop.get("required") is False):
+                    return True
+
+        raw = raw.get("child-binding")
+
+    return False
+
+
+def _include_names(raw):
+    """Yield the file names included by a binding, or by its child bindings."""
+    while isinstance(raw, dict):
+        include = raw.get("include")
+        if isinstance(include, str):
+            yield include
+        elif isinstance(include, list):
+            for elem in include:
+                if isinstance(elem, str):
+                    yield elem
+                elif isinstance(elem, dict) and isinstance(elem.get("name"), str):
+                    yield elem["name"]
+
+        raw = raw.get("child-binding")
+
+
+@functools.lru_cache(maxsize=1)
+def _read_property_allowlist(allow_path, mtime_ns):
+    """
+    Parse the property names allowlist. mtime_ns is only there to key the
+    cache, so that the file is parsed again if it changes.
+    """
+    if yaml is None:
+        return frozenset()
+
+    try:
+        data = yaml.load(allow_path.read_text(encoding="utf-8", errors="replace"), Loader=_YAML_LOADER)
+        if data:
+            return frozenset(data)
+    except Exception:
+        pass
+
+    return frozenset()
+
 
 class DevicetreeBindingsCheck(ComplianceTest):
     """
@@ -24,6 +151,9 @@ class DevicetreeBindingsCheck(ComplianceTest):
     doc = "See https://docs.zephyrproject.org/latest/build/dts/bindings-syntax.html for more details."
     path_hint = "<git-top>"
 
+    # edtlib module, once imported
+    _edtlib_mod = None
+
     def run(self, mode="default"):
         """
         Run the DevicetreeBindings check.
@@ -31,37 +161,32 @@ class DevicetreeBindingsCheck(ComplianceTest):
         Args:
             mode: Analysis mode - "path" (explicit paths), "diff" (git diff), or "default"
         """
-        bindings_diff, bindings = self.get_yaml_bindings(mode)
+        bindings_diff, bindings, clean = self.get_yaml_bindings(mode)
 
         if mode in ("path", "default"):
             # PATH/DEFAULT MODE
-            if not bindings:
+            if not bindings and not clean:
                 self.skip("no devicetree bindings found in selected paths")
                 return
         else:
-            # DIFF MODE
+            # DIFF MODE: bindings_diff only holds binding roots with changed
+            # files, so there is no need to ask git again whether they changed
             if not bindings_diff:
                 self.skip("no changes to bindings were made")
                 return
-            try:
-                subprocess.check_call(["git", "diff", "--quiet", utils.COMMIT_RANGE] + bindings_diff, cwd=utils.GIT_TOP)
-                self.skip("no changes to bindings were made")
-                return
-            except subprocess.CalledProcessError:
-                pass
 
         for binding in bindings:
-            self.check(binding, self.check_yaml_property_name)
-            self.check(binding, self.required_false_check)
-
-    @staticmethod
-    def check(binding, callback):
-        while binding is not None:
-            callback(binding)
-            binding = binding.child_binding
+            # run both checks in a single walk down the child bindings
+            while binding is not None:
+                self.check_yaml_property_name(binding)
+                self.required_false_check(binding)
+                binding = binding.child_binding
 
     def _get_edtlib(self):
         """Load edtlib from Zephyr."""
+        if DevicetreeBindingsCheck._edtlib_mod is not None:
+            return DevicetreeBindingsCheck._edtlib_mod
+
         dts_lib = utils.ZEPHYR_BASE / "scripts" / "dts" / "python-devicetree" / "src"
         if str(dts_lib) not in sys.path:
             sys.path.insert(0, str(dts_lib))
@@ -70,25 +195,19 @@ class DevicetreeBindingsCheck(ComplianceTest):
         except Exception:
             self.skip("python-devicetree (edtlib) not available from deps/zephyr")
             return None
+
+        DevicetreeBindingsCheck._edtlib_mod = edtlib
         return edtlib
 
     def _load_property_allowlist(self):
         """Load property names allowlist from bindings_properties_allowlist.yaml."""
-        allow = set()
         allow_path = utils.GIT_TOP / "bindings_properties_allowlist.yaml"
-        if not allow_path.exists():
-            return allow
-
         try:
-            import yaml
-
-            data = yaml.safe_load(allow_path.read_text(encoding="utf-8", errors="replace"))
-            if data:
-                allow = set(data)
-        except Exception:
-            allow = set()
+            mtime_ns = allow_path.stat().st_mtime_ns
+        except OSError:
+            return frozenset()
 
-        return allow
+        return _read_property_allowlist(allow_path, mtime_ns)
 
     def get_yaml_bindings(self, mode):
         """
@@ -100,64 +219,132 @@ class DevicetreeBindingsCheck(ComplianceTest):
             mode: Analysis mode - "path", "diff", or "default"
 
         Returns:
-            Tuple of (bindings_diff, bindings)
+            Tuple of (bindings_diff, bindings, clean), where clean holds the
+            YAMLs left out of bindings because they cannot fail the checks
         """
         BINDINGS_PATH = "dts/bindings/"
         BINDINGS_MATCH = "/" + BINDINGS_PATH
 
-        bindings_diff_dir = set()
+        # dict rather than set, so roots are walked in a stable order
+        bindings_diff_dir = {}
         yamls = []
 
-        def _is_binding_yaml(p: str) -> bool:
-            p = p.replace("\\", "/")
-            return (p.startswith(BINDINGS_PATH) or (BINDINGS_MATCH in p)) and p.endswith(".yaml")
-
         if mode in ("path", "default"):
             # PATH/DEFAULT MODE: Scan filesystem directly
-            for f in utils.files_from_paths():
-                if _is_binding_yaml(f):
-                    yamls.append(f)
+            is_binding_yaml = _BINDING_YAML_RE.search
+            yamls = [f for f in utils.files_from_paths() if is_binding_yaml(f)]
             bindings_diff = []
         else:
             # DIFF MODE: Find which binding roots changed, then scan all yamls under them
-            for file_name in utils.get_files(filter="d"):
+            for file_name in utils.get_files(filter="ACMR"):
                 f = file_name.replace("\\", "/")
                 if f.startswith(BINDINGS_PATH) or (BINDINGS_MATCH in f):
                     before, _, _ = f.partition(BINDINGS_PATH)
-                    bindings_diff_dir.add(os.path.join(before, BINDINGS_PATH))
+                    bindings_diff_dir[os.path.join(before, BINDINGS_PATH)] = None
 
             for path in bindings_diff_dir:
-                yamls.extend(glob(f"{os.fspath(path)}/**/*.yaml", recursive=True))
+                yamls.extend(_iter_yaml(path))
 
-            bindings_diff = sorted(bindings_diff_dir)
+            bindings_diff = list(bindings_diff_dir)
 
         edtlib = self._get_edtlib()
         if edtlib is None:
-            return bindings_diff, []
+            return bindings_diff, [], []
 
         # Add Zephyr bindings for reference
         zephyr_bindings_dir = utils.ZEPHYR_BASE / "dts" / "bindings"
         support_yamls = []
         if zephyr_bindings_dir.exists():
-            support_yamls = glob(f"{os.fspath(zephyr_bindings_dir)}/**/*.yaml", recursive=True)
+            support_yamls = _support_yamls(zephyr_bindings_dir)
 
-        parse_list = list(dict.fromkeys(yamls + support_yamls))
+        # Parsing every Zephyr binding is what makes this check slow, so only
+        # pass the ones the selected bindings actually include, and skip the
+        # bindings that cannot fail altogether
+        parse_list, clean = self._parse_set(yamls, support_yamls)
+        if clean:
+            logging.debug(f"DevicetreeBindings: {len(clean)} binding(s) cannot fail, not parsing them")
+            clean_set = set(clean)
+            yamls = [y for y in yamls if y not in clean_set]
 
         bindings_all = edtlib.bindings_from_paths(parse_list, ignore_errors=True)
 
-        wanted = {str((utils.GIT_TOP / y).resolve()) for y in yamls}
-        bindings = [b for b in bindings_all if str(Path(b.path).resolve()) in wanted]
+        # edtlib keeps the paths it was given, so plain string normalization
+        # is enough to match them back without resolving each one
+        git_top = str(utils.GIT_TOP)
+        wanted = {os.path.normpath(os.path.join(git_top, y)) for y in yamls}
+        bindings = [b for b in bindings_all if os.path.normpath(os.path.join(git_top, b.path)) in wanted]
+
+        return bindings_diff, bindings, clean
 
-        return bindings_diff, bindings
+    def _parse_set(self, yamls, support_yamls):
+        """
+        Decide what edtlib needs to parse.
+
+        Returns a tuple (parse_list, clean). clean lists the yamls that
+        cannot fail the checks: neither they nor anything they include has a
+        property name with underscores or a 'required: false'. parse_list
+        holds the other yamls and the support YAMLs they include, directly or
+        not, in 'yamls + support_yamls' order.
+
+        Includes are resolved by file name the way edtlib does it, so the
+        same files are picked as if all support YAMLs were passed to it.
+        """
+        all_yamls = list(dict.fromkeys(yamls + support_yamls))
+        if yaml is None:
+            return all_yamls, []
+
+        fname2path = {os.path.basename(path): path for path in all_yamls}
+        includes = {}
+        suspects = set()
+        seen = set(yamls)
+        todo = list(seen)
+        while todo:
+            path = todo.pop()
+            try:
+                with open(path, encoding="utf-8") as f:
+                    raw = yaml.load(f, Loader=_YAML_LOADER)
+            except Exception:
+                # edtlib will fail on (and ignore) this one too, but leave
+                # that decision to it
+                suspects.add(path)
+                continue
+
+            if _may_fail(raw):
+                suspects.add(path)
+
+            includes[path] = [fname2path[name] for name in _include_names(raw) if name in fname2path]
+            for inc in includes[path]:
+                if inc not in seen:
+                    seen.add(inc)
+                    todo.append(inc)
+
+        def closure(roots):
+            reached = set(roots)
+            stack = list(reached)
+            while stack:
+                for inc in includes.get(stack.pop(), ()):
+                    if inc not in reached:
+                        reached.add(inc)
+                        stack.append(inc)
+            return reached
+
+        clean = [y for y in dict.fromkeys(yamls) if suspects.isdisjoint(closure([y]))]
+        needed = closure(set(yamls).difference(clean))
+
+        return [path for path in all_yamls if path in needed], clean
 
     def check_yaml_property_name(self, binding):
         """
         Checks if the property names in the binding file contain underscores.
         """
+        underscored = [prop_name for prop_name in binding.prop2specs if "_" in prop_name]
+        if not underscored:
+            return
+
         allowlist = self._load_property_allowlist()
 
-        for prop_name in binding.prop2specs:
-            if "_" in prop_name and prop_name not in allowlist:
+        for prop_name in underscored:
+            if prop_name not in allowlist:
                 better_prop = prop_name.replace("_", "-")
                 self.failure(
                     f"{binding.path}: property '{prop_name}' contains underscores.\n"
@@ -5,11 +5,13 @@ DevicetreeLinting compliance check.
 Checks DeviceTree files for syntax and formatting issues using dts-linter.
 """
 
+import itertools
 import json
 import logging
 import os
 import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from . import utils
@@ -17,6 +19,69 @@ from .base import ComplianceTest
 
 logger = logging.getLogger(__name__)
 
+# Directories that never hold sources to lint, on top of utils.IGNORE_PATH_PARTS
+_SKIP_DIRS = frozenset({"twister-out", "node_modules", "__pycache__"})
+
+# Marker file that excludes a directory and everything below it from linting
+_IGNORE_MARKER = ".dts_lint_ignore"
+
+
+def _arg_budget():
+    """Return roughly how many bytes of arguments a new process may be given."""
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (AttributeError, ValueError, OSError):
+        arg_max = -1
+    if arg_max <= 0:
+        # Windows limits the whole command line to 32767 characters
+        return 32000
+
+    # The environment shares the limit with the arguments; every string also
+    # costs a pointer and a terminator
+    env_size = sum(len(os.fsencode(k)) + len(os.fsencode(v)) + 10 for k, v in os.environ.items())
+    return max(arg_max - env_size - 8192, 32000)
+
+
+def _batches(files, base_cmd):
+    """
+    Split files into batches of --file arguments for base_cmd, as
+    (index of the first file, batch) pairs.
+
+    Batches are as large as the argument size limit allows, so that Node.js
+    starts as few times as possible, but are spread over the available CPUs.
+    """
+    budget = _arg_budget() - sum(len(os.fsencode(arg)) + 10 for arg in base_cmd)
+    max_files = -(-len(files) // utils.available_cpus())
+
+    start = 0
+    while start < len(files):
+        end = start
+        used = 0
+        while end < len(files) and end - start < max_files:
+            # "--file", the path, their terminators and pointers
+            used += len(os.fsencode(files[end])) + 25
+            if used > budget and end > start:
+                break
+            end += 1
+        yield start, files[start:end]
+        start = end
+
+
+def _append_file(out, path):
+    """Append the file at path to the binary file object out."""
+    with open(path, "rb") as src:
+        if hasattr(os, "sendfile"):
+            # copy in the kernel, falling back if the platform refuses
+            out.flush()
+            try:
+                while os.sendfile(out.fileno(), src.fileno(), None, 1 << 20):
+                    pass
+                return
+            except OSError:
+                pass
+
+        shutil.copyfileobj(src, out, 1 << 20)
+
 
 class DevicetreeLintingCheck(ComplianceTest):
     """
@@ -33,9 +98,9 @@ class DevicetreeLintingCheck(ComplianceTest):
             return False
         try:
             self.npx_exe = npx_executable
-            # --no prevents npx from fetching from registry
+            self.linter_cmd = self._linter_cmd()
             subprocess.run(
-                [self.npx_exe, "--prefix", "./scripts/checks", "--no", 'dts-linter', "--", "--version"],
+                [*self.linter_cmd, "--version"],
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL,
                 check=True,
@@ -45,38 +110,56 @@ class DevicetreeLintingCheck(ComplianceTest):
         except subprocess.CalledProcessError:
             return False
 
+    def _linter_cmd(self):
+        """
+        Return the command prefix that runs dts-linter.
+
+        npx is a Node.js program too, so going through it costs a second Node.js
+        startup per batch. Run the locally installed dts-linter directly when
+        it is there.
+        """
+        prefix = utils.GIT_TOP / "scripts" / "checks"
+        if linter_exe := shutil.which("dts-linter", path=str(prefix / "node_modules" / ".bin")):
+            return [linter_exe]
+
+        # --no prevents npx from fetching from registry
+        return [self.npx_exe, "--prefix", str(prefix), "--no", "dts-linter", "--"]
+
     def _parse_json_output(self, cmd, cwd=None):
         """Run command and parse single JSON output with issues array"""
-        logging.debug(f"Running: {' '.join(cmd)}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Running: {' '.join(cmd)}")
 
+        # Keep the output as bytes: json_loads() takes them directly, which
+        # saves decoding a copy of what can be a large report
         result = subprocess.run(
             cmd,
             capture_output=True,
             check=False,
-            text=True,
             cwd=cwd or utils.GIT_TOP,
         )
+        stdout = result.stdout
 
         # dts-linter returns exit code 1 when it finds formatting issues, which is expected
         # Only treat it as a fatal error if return code is something else (like 127 = command not found)
         if result.returncode not in (0, 1):
             error_msg = f"dts-linter exited with unexpected code {result.returncode}"
             if result.stderr:
-                error_msg += f"\nstderr: {result.stderr}"
-            if result.stdout:
-                error_msg += f"\nstdout: {result.stdout}"
+                error_msg += f"\nstderr: {result.stderr.decode(errors='replace')}"
+            if stdout:
+                error_msg += f"\nstdout: {stdout.decode(errors='replace')}"
             raise RuntimeError(error_msg)
 
-        if not result.stdout.strip():
+        if not stdout or stdout.isspace():
             # No output means no issues found (success)
             return None
 
         try:
-            json_data = json.loads(result.stdout)
+            json_data = utils.json_loads(stdout)
             return json_data
-        except json.JSONDecodeError as e:
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
             # Show what we tried to parse for debugging
-            preview = result.stdout[:500] if len(result.stdout) > 500 else result.stdout
+            preview = stdout[:500].decode(errors="replace")
             raise RuntimeError(f"Failed to parse dts-linter JSON output: {e}\nOutput preview: {preview}") from e
 
     def _process_json_output(self, json_output: dict):
@@ -101,6 +184,31 @@ class DevicetreeLintingCheck(ComplianceTest):
                 end_col = issue.get("endCol", None)
                 self.fmtd_failure(level, title, file, line, col, message, end_line, end_col)
 
+    def _run_batch(self, cmd, cwd=None):
+        """Run one dts-linter batch, returning (json_output, exception)"""
+        try:
+            return self._parse_json_output(cmd, cwd=cwd), None
+        except (subprocess.CalledProcessError, RuntimeError) as ex:
+            return None, ex
+
+    def _batch_failure(self, ex, app_dir=None):
+        where = f" in {app_dir.relative_to(utils.GIT_TOP)}" if app_dir else ""
+        if isinstance(ex, subprocess.CalledProcessError):
+            stderr_output = ex.stderr if ex.stderr else ""
+            if stderr_output.strip():
+                self.failure(f"dts-linter found issues{where}:\n{stderr_output}")
+            else:
+                err = "dts-linter failed"
+                err += f" for {app_dir.relative_to(utils.GIT_TOP)}" if app_dir else ""
+                err += " with no output. "
+                err += "Make sure you install Node.js and then run "
+                err += "[npm --prefix ./scripts/checks ci] inside WORKSPACE_BASE"
+                self.failure(err)
+        elif app_dir:
+            self.failure(f"Error{where}: {ex}")
+        else:
+            self.failure(f"{ex}")
+
     def run(self, mode="default"):
         """
         Run the DevicetreeLinting check.
@@ -119,58 +227,30 @@ class DevicetreeLintingCheck(ComplianceTest):
             return
 
         temp_patch_files = []
+        # (cmd, app_dir) per batch; app_dir is None in diff mode
+        jobs = []
 
         if mode == "diff":
             # DIFF MODE: Analyze only modified DTS files from git diff
             logging.info("DevicetreeLinting: analyzing modified files from git diff")
-            files = utils.get_files(filter="d")
+            files = utils.get_files(filter="ACMR")
             dts_files = [f for f in files if f.endswith((".dts", ".dtsi", ".overlay"))]
 
             if not dts_files:
                 self.skip('No DTS files modified')
                 return
 
-            batch_size = 500
-
-            for i in range(0, len(dts_files), batch_size):
-                batch = dts_files[i : i + batch_size]
+            base_cmd = [*self.linter_cmd, "--outputFormat", "json", "--format", "--patchFile"]
 
+            for i, batch in _batches(dts_files, base_cmd):
                 # use a temporary file for each batch
                 temp_patch = utils.GIT_TOP / f"dts_linter_{i}.patch"
                 temp_patch_files.append(temp_patch)
 
-                cmd = [
-                    self.npx_exe,
-                    "--prefix",
-                    str(utils.GIT_TOP / "scripts" / "checks"),
-                    "--no",
-                    "dts-linter",
-                    "--",
-                    "--outputFormat",
-                    "json",
-                    "--format",
-                    "--patchFile",
-                    str(temp_patch),
-                ]
-                for file in batch:
-                    cmd.extend(["--file", file])
-
-                try:
-                    json_output = self._parse_json_output(cmd)
-                    if json_output:
-                        self._process_json_output(json_output)
-
-                except subprocess.CalledProcessError as ex:
-                    stderr_output = ex.stderr if ex.stderr else ""
-                    if stderr_output.strip():
-                        self.failure(f"dts-linter found issues:\n{stderr_output}")
-                    else:
-                        err = "dts-linter failed with no output. "
-                        err += "Make sure you install Node.js and then run "
-                        err += "[npm --prefix ./scripts/checks ci] inside WORKSPACE_BASE"
-                        self.failure(err)
-                except RuntimeError as ex:
-                    self.failure(f"{ex}")
+                cmd = [*base_cmd, str(temp_patch)]
+                cmd.extend(itertools.chain.from_iterable(("--file", file) for file in batch))
+
+                jobs.append((cmd, None))
 
         else:
             # PATH/DEFAULT MODE: Directory scanning mode with application detection
@@ -191,83 +271,68 @@ class DevicetreeLintingCheck(ComplianceTest):
             logging.debug(f"Found {len(applications)} application(s) to analyze")
 
             # Process each application separately with its own context
-            app_number = 0
-
-            for app_dir in applications:
-                app_number += 1
-
-                # Find DTS files in this specific application
-                dts_files = self._find_dts_files_in_app(app_dir)
-
+            for app_number, (app_dir, dts_files) in enumerate(applications.items(), 1):
                 if not dts_files:
                     continue
 
-                # Process files in batches (dts-linter can handle multiple files at once)
-                batch_size = 500
-                for i in range(0, len(dts_files), batch_size):
-                    batch = dts_files[i : i + batch_size]
+                # Make file paths relative to app_dir, or use the absolute
+                # path if the file is outside of it. Plain string prefixes
+                # keep Path objects out of the per-file loop.
+                git_top = str(utils.GIT_TOP)
+                app_prefix = os.path.join(str(app_dir), "")
+                app_files = []
+                for file in dts_files:
+                    file_path = os.path.join(git_top, file)
+                    if file_path.startswith(app_prefix):
+                        file_path = file_path[len(app_prefix) :]
+                    app_files.append(file_path)
+
+                # Everything but the patch file and the files is the same for
+                # all batches of the application
+                base_cmd = [
+                    *self.linter_cmd,
+                    "--cwd",
+                    str(app_dir),  # Set working directory to application root
+                    "--outputFormat",
+                    "json",
+                    "--format",
+                    "--patchFile",
+                ]
 
+                # Process files in batches (dts-linter can handle multiple files at once)
+                for i, batch in _batches(app_files, base_cmd):
                     # use a temporary file for each batch (absolute path so it's created in GIT_TOP)
                     temp_patch = utils.GIT_TOP / f"dts_linter_app{app_number}_batch{i}.patch"
                     temp_patch_files.append(temp_patch)
 
-                    cmd = [
-                        self.npx_exe,
-                        "--prefix",
-                        str(utils.GIT_TOP / "scripts" / "checks"),  # Use absolute path for --prefix
-                        "--no",
-                        "dts-linter",
-                        "--",
-                        "--cwd",
-                        str(app_dir),  # Set working directory to application root
-                        "--outputFormat",
-                        "json",
-                        "--format",
-                        "--patchFile",
-                        str(temp_patch),  # Use absolute path so patch is created in GIT_TOP
-                    ]
-                    for file in batch:
-                        # Make file path relative to app_dir
-                        file_path = utils.GIT_TOP / file
-                        try:
-                            rel_to_app = file_path.relative_to(app_dir)
-                            cmd.extend(["--file", str(rel_to_app)])
-                        except ValueError:
-                            # File is outside app_dir, use absolute path
-                            cmd.extend(["--file", str(file_path)])
+                    cmd = [*base_cmd, str(temp_patch)]
+                    cmd.extend(itertools.chain.from_iterable(("--file", file) for file in batch))
 
-                    try:
-                        json_output = self._parse_json_output(cmd, cwd=app_dir)
-                        if json_output:
-                            self._process_json_output(json_output)
-
-                    except subprocess.CalledProcessError as ex:
-                        stderr_output = ex.stderr if ex.stderr else ""
-                        if stderr_output.strip():
-                            self.failure(
-                                f"dts-linter found issues in {app_dir.relative_to(utils.GIT_TOP)}:\n{stderr_output}"
-                            )
-                        else:
-                            err = f"dts-linter failed for {app_dir.relative_to(utils.GIT_TOP)} with no output. "
-                            err += "Make sure you install Node.js and then run "
-                            err += "[npm --prefix ./scripts/checks ci] inside WORKSPACE_BASE"
-                            self.failure(err)
-                    except RuntimeError as ex:
-                        self.failure(f"Error in {app_dir.relative_to(utils.GIT_TOP)}: {ex}")
+                    jobs.append((cmd, app_dir))
+
+        # Each batch pays the Node.js startup, so run them concurrently. The
+        # output is still processed in batch order to keep failures stable.
+        if jobs:
+            with ThreadPoolExecutor(max_workers=min(len(jobs), utils.available_cpus())) as executor:
+                results = list(executor.map(lambda job: self._run_batch(*job), jobs))
+
+            for (_, app_dir), (json_output, ex) in zip(jobs, results, strict=True):
+                if ex is not None:
+                    self._batch_failure(ex, app_dir)
+                elif json_output:
+                    self._process_json_output(json_output)
 
         # merge all temp patch files into one
         if temp_patch_files:
             final_patch_path = utils.GIT_TOP / "dts_linter.patch"
             with open(final_patch_path, "wb") as final_patch:
                 for patch in temp_patch_files:
-                    if patch.exists():
-                        with open(patch, "rb") as f:
-                            shutil.copyfileobj(f, final_patch)
-
-            # cleanup temporary patch files
-            for patch in temp_patch_files:
-                if patch.exists():
-                    patch.unlink()
+                    # batches without issues may not write a patch file
+                    try:
+                        _append_file(final_patch, patch)
+                        os.unlink(patch)
+                    except FileNotFoundError:
+                        pass
 
             # If -n/--no-case-output is set, also remove the final patch file
             if hasattr(self, 'global_args') and self.global_args.no_case_output:
@@ -280,57 +345,58 @@ class DevicetreeLintingCheck(ComplianceTest):
 
     def _find_applications(self, search_dirs):
         """
-        Find all Zephyr applications within the given directories.
+        Find all Zephyr applications within the given directories, along with
+        their DeviceTree files, in a single walk.
         An application is a directory containing prj.conf or CMakeLists.txt.
+        Applications nested in another one are part of the outer application.
+        Hidden directories, build outputs and directories containing a
+        .dts_lint_ignore file are skipped.
 
-        Returns list of application directories (as Path objects).
+        Returns a dict mapping each application directory (as a Path) to its
+        DeviceTree files, relative to GIT_TOP.
         """
-        applications = []
+        applications = {}
+        git_top = os.path.join(str(utils.GIT_TOP), "")
 
         for search_dir in search_dirs:
             if not search_dir.exists():
                 logging.warning(f"DevicetreeLinting: Directory does not exist: {search_dir}")
                 continue
 
-            # Check if search_dir itself is an application
-            if (search_dir / "prj.conf").exists() or (search_dir / "CMakeLists.txt").exists():
-                applications.append(search_dir)
-            else:
-                # Search for applications in subdirectories
-                for root, dirs, files in os.walk(search_dir):
-                    root_path = Path(root)
+            # Root of the application being walked, if any. os.walk() is
+            # depth-first, so its subtree is done once a root outside it shows up.
+            app_root = None
+
+            for root, dirs, files in os.walk(search_dir):
+                if _IGNORE_MARKER in files:
+                    dirs[:] = []
+                    continue
 
-                    # Exclude directories in IGNORE_PATH_PARTS
-                    dirs[:] = [d for d in dirs if d not in utils.IGNORE_PATH_PARTS]
+                # Exclude hidden directories, build outputs and IGNORE_PATH_PARTS
+                dirs[:] = [
+                    d
+                    for d in dirs
+                    if not d.startswith((".", "build_")) and d not in _SKIP_DIRS and d not in utils.IGNORE_PATH_PARTS
+                ]
 
+                if app_root is None or not root.startswith(app_root):
+                    app_root = None
                     # Check if this directory is an application
-                    if "prj.conf" in files or "CMakeLists.txt" in files:
-                        applications.append(root_path)
-                        # Don't recurse into subdirectories of an application
+                    if "prj.conf" not in files and "CMakeLists.txt" not in files:
+                        continue
+                    if Path(root) in applications:
+                        # Already found through another search directory
                         dirs[:] = []
+                        continue
 
-        return applications
-
-    def _find_dts_files_in_app(self, app_dir):
-        """
-        Find all DeviceTree files within a specific application directory.
-        Returns paths relative to GIT_TOP.
-        """
-        dts_files = []
+                    app_root = os.path.join(root, "")
+                    dts_files = applications[Path(root)] = []
 
-        for root, dirs, files in os.walk(app_dir):
-            # Exclude directories in IGNORE_PATH_PARTS
-            dirs[:] = [d for d in dirs if d not in utils.IGNORE_PATH_PARTS]
+                for file in files:
+                    if file.endswith(('.dts', '.dtsi', '.overlay')):
+                        full_path = os.path.join(root, file)
+                        # Make path relative to GIT_TOP, skipping files outside of it
+                        if full_path.startswith(git_top):
+                            dts_files.append(full_path[len(git_top) :])
 
-            for file in files:
-                if file.endswith(('.dts', '.dtsi', '.overlay')):
-                    full_path = Path(root) / file
-                    # Make path relative to GIT_TOP
-                    try:
-                        rel_path = full_path.relative_to(utils.GIT_TOP)
-                        dts_files.append(str(rel_path))
-                    except ValueError:
-                        # Path is not relative to GIT_TOP, skip it
-                        continue
-
-        return dts_files
+        return applications
@@ -7,13 +7,18 @@ Checks for Kconfig warnings/errors such as undefined Kconfig variables.
 
 import argparse
 import collections
+import contextlib
+import hashlib
 import logging
 import os
 import re
 import shutil
+import string
 import subprocess
 import sys
 import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from . import utils
@@ -21,6 +26,176 @@ from .base import ComplianceTest, EndTest
 
 logger = logging.getLogger(__name__)
 
+# Warning: This needs to work with both --perl-regexp and the 're' module.
+# (?:...) is a non-capturing group.
+
+# References to Kconfig symbols outside Kconfig files
+_CONFIG_REF_RE = re.compile(r"\bCONFIG_[A-Z0-9_]+\b(?!\s*##|[$@{*])")
+
+# One <path>\0<linenr>\0CONFIG_FOO line per reference in the output of
+# _grep_config_refs(), parsed in a single scan. Groups: path, line number, and
+# symbol name with no CONFIG_ prefix.
+_GREP_REF_RE = re.compile(r"^([^\0\n]*)\0([0-9]+)\0CONFIG_([A-Z0-9_]+)$", re.MULTILINE)
+
+# Kconfig symbol definitions and logging template modules, grepped in
+# samples/ and tests/. These need no PCRE features, so git grep gets POSIX ERE
+# versions (--extended-regexp), which its builtin engine matches faster. Keep
+# each pair in sync; the 're' versions extract the names from the matches.
+_DEF_SYM_RE = re.compile(r"^\s*(?:menu)?config\s*([A-Z0-9_]+)\s*(?:#|$)", re.MULTILINE)
+_DEF_SYM_ERE = r"^[[:space:]]*(menu)?config[[:space:]]*([A-Z0-9_]+)[[:space:]]*(#|$)"
+_LOG_MOD_RE = re.compile(r"^\s*(?:module\s*=\s*)([A-Z0-9_]+)\s*(?:#|$)", re.MULTILINE)
+_LOG_MOD_ERE = r"^[[:space:]]*module[[:space:]]*=[[:space:]]*([A-Z0-9_]+)[[:space:]]*(#|$)"
+
+# Zephyr internal directories (relative paths from ZEPHYR_BASE) whose undefined
+# symbol warnings are not reported, matched against the "- Referenced at
+# <path>:<line>:" lines of the warnings in a single search
+_ZEPHYR_INTERNAL_DIRS = (
+    "arch",
+    "boards",
+    "doc",
+    "drivers",
+    "dts",
+    "include",
+    "kernel",
+    "lib",
+    "misc",
+    "modules",
+    "samples",
+    "scripts",
+    "share",
+    "soc",
+    "subsys",
+    "tests",
+)
+_ZEPHYR_INTERNAL_REF_RE = re.compile(rf"at (?:deps/zephyr/)?(?:{'|'.join(_ZEPHYR_INTERNAL_DIRS)})/")
+
+
+class _SymCharTable(dict):
+    """
+    str.translate() table that replaces all characters but ASCII letters,
+    digits and '_' with '_', to turn board, qualifier and module names into
+    symbol names. Entries are added as characters are first seen, so non-ASCII
+    characters are replaced too.
+    """
+
+    _KEEP = frozenset(string.ascii_letters + string.digits + "_")
+
+    def __missing__(self, ordinal):
+        self[ordinal] = ordinal if chr(ordinal) in self._KEEP else "_"
+        return self[ordinal]
+
+
+_SYM_CHAR_TABLE = _SymCharTable()
+
+# Roots in the settings file written by zephyr_module.py, one
+# "<NAME>_ROOT":"<path>" per line
+_SETTINGS_ROOT_RE = re.compile(r'"(BOARD_ROOT|SOC_ROOT|DTS_ROOT)":"([^"]+)"')
+
+
+def _read_settings_roots(settings_file):
+    """
+    Returns a dict with the BOARD_ROOT, SOC_ROOT and DTS_ROOT paths (lists of
+    strings, in file order) from a settings file written by zephyr_module.py.
+    The lists are empty if the file does not exist (e.g. with --no-modules).
+    """
+    roots = {"BOARD_ROOT": [], "SOC_ROOT": [], "DTS_ROOT": []}
+    try:
+        with open(settings_file) as f:
+            content = f.read()
+    except FileNotFoundError:
+        return roots
+
+    for name, path in _SETTINGS_ROOT_RE.findall(content):
+        roots[name].append(path)
+    return roots
+
+
+# Age after which the directories in .cache/kconfig/ other than the current
+# one are removed, in seconds. Concurrent runs only use theirs for a short
+# while.
+_KCONFIG_CACHE_MAX_AGE = 3600
+
+
+def _prune_kconfig_cache(cache_root, keep):
+    """
+    Removes the directories in cache_root other than keep that were not used
+    in the last _KCONFIG_CACHE_MAX_AGE seconds: the files of older
+    fingerprints and those left behind by interrupted runs.
+    """
+    deadline = time.time() - _KCONFIG_CACHE_MAX_AGE
+    try:
+        with os.scandir(cache_root) as it:
+            for entry in it:
+                if entry.path == str(keep):
+                    continue
+                with contextlib.suppress(OSError):
+                    if entry.stat(follow_symlinks=False).st_mtime < deadline:
+                        shutil.rmtree(entry.path)
+    except OSError:
+        pass
+
+
+def _west_config(path):
+    """
+    Returns the contents of the configuration file of the west workspace that
+    'path' is in, or b"" if there is none.
+    """
+    for d in (path, *path.parents):
+        try:
+            with open(d / ".west" / "config", "rb") as f:
+                return f.read()
+        except OSError:
+            continue
+    return b""
+
+
+def _tree_state(path, pathspecs):
+    """
+    Returns the HEAD commit of the Git checkout 'path' is in and the status,
+    size and mtime of the files modified or untracked under 'pathspecs'
+    (relative to 'path'), as bytes. Returns None if 'path' is not in a Git
+    checkout.
+    """
+    if not os.path.isdir(path):
+        # Nothing is generated from it until it exists
+        return f"{path}\0".encode()
+
+    rev_parse = utils.git("rev-parse", "--show-toplevel", "HEAD", cwd=path, ignore_non_zero=True).split("\n")
+    if len(rev_parse) != 2:
+        return None
+    top, head = rev_parse
+
+    # .cache/ is left out, in case it is not ignored by the repository
+    status = utils.git(
+        "status",
+        "--porcelain",
+        "-z",
+        "--untracked-files=all",
+        "--",
+        *pathspecs,
+        ":!.cache",
+        cwd=path,
+        ignore_non_zero=True,
+    )
+    state = [path, head, status]
+
+    # Entries are "XY <path>", and renames and copies are followed by the
+    # original path as an entry of its own. What matters is the current
+    # contents. Paths are relative to the top of the checkout.
+    entries = iter(status.split("\0"))
+    for entry in entries:
+        if len(entry) <= 3:
+            continue
+        if "R" in entry[:2] or "C" in entry[:2]:
+            next(entries, None)
+        try:
+            st = os.stat(os.path.join(top, entry[3:]))
+        except OSError:
+            continue
+        state.append(f"{st.st_mtime_ns}:{st.st_size}")
+
+    return "\0".join(state).encode() + b"\0"
+
 
 class KconfigCheck(ComplianceTest):
     """
@@ -41,6 +216,15 @@ class KconfigCheck(ComplianceTest):
         """
         full = True
         self.no_modules = False
+        # Parsed trees by (Kconfig path, hwm), and their defined symbols and
+        # menu nodes, so that apps sharing a Kconfig tree only parse it once
+        self._kconf_cache = {}
+        self._defined_syms_cache = {}
+        self._nodes_cache = {}
+        # Directory of the generated Kconfig files, shared by all parses (see
+        # _kconfig_binary_dir())
+        self._binary_dir = None
+        self._temp_dir = None
         filename = "Kconfig"
         hwm = None
 
@@ -60,12 +244,16 @@ class KconfigCheck(ComplianceTest):
             analyze_all = False
 
         # Execute analysis
-        if analyze_all:
-            logging.info("Kconfig: analyzing entire repository")
-            self._run_full_analysis(full, filename, hwm)
-        else:
-            logging.info(f"Kconfig: analyzing {', '.join(app_dirs)}")
-            self._run_multi_app_analysis(app_dirs, full, filename, hwm)
+        try:
+            if analyze_all:
+                logging.info("Kconfig: analyzing entire repository")
+                self._run_full_analysis(full, filename, hwm)
+            else:
+                logging.info(f"Kconfig: analyzing {', '.join(app_dirs)}")
+                self._run_multi_app_analysis(app_dirs, full, filename, hwm)
+        finally:
+            if self._temp_dir is not None:
+                shutil.rmtree(self._temp_dir, ignore_errors=True)
 
     def _run_full_analysis(self, full, filename, hwm):
         """Analyze entire repository."""
@@ -92,14 +280,20 @@ class KconfigCheck(ComplianceTest):
         # Run global Kconfig structure checks ONCE
         logging.info("Running global Kconfig structure checks")
 
-        # Use first app with Kconfig, or fallback to main_node, then Zephyr
-        base_kconfig = None
+        # Entry Kconfig of each app that has one, looked up once for both the
+        # global and the per-app checks
+        app_kconfigs = {}
         for app_dir in app_dirs:
             kconfig_path = utils.WORKSPACE_BASE / app_dir / filename
             if kconfig_path.exists():
-                base_kconfig = str(kconfig_path)
-                logging.info(f"Using {app_dir}/{filename} for global checks")
-                break
+                app_kconfigs[app_dir] = str(kconfig_path)
+
+        # Use first app with Kconfig, or fallback to main_node, then Zephyr
+        base_kconfig = None
+        for app_dir, kconfig_path in app_kconfigs.items():
+            base_kconfig = kconfig_path
+            logging.info(f"Using {app_dir}/{filename} for global checks")
+            break
 
         if not base_kconfig:
             base_kconfig = self._find_entry_kconfig("deps/zephyr", filename)
@@ -119,30 +313,41 @@ class KconfigCheck(ComplianceTest):
             return
 
         logging.info("Running per-application CONFIG_* reference checks")
+        existing_dirs = []
         for app_dir in app_dirs:
-            self._check_app_config_references(app_dir, filename, hwm)
-
-    def _check_app_config_references(self, app_dir, filename, hwm):
-        """Check CONFIG_* references for a single application."""
-        app_path = utils.WORKSPACE_BASE / app_dir
-        if not app_path.is_dir():
-            logging.warning(f"Skipping {app_dir}: directory not found")
+            if (utils.WORKSPACE_BASE / app_dir).is_dir():
+                existing_dirs.append(app_dir)
+            else:
+                logging.warning(f"Skipping {app_dir}: directory not found")
+        if not existing_dirs:
             return
 
+        # The git greps of the apps are independent, so they run in the
+        # background while the Kconfig trees are parsed here (Kconfiglib
+        # relies on os.environ, so parsing stays in this thread). The greps
+        # get a snapshot of the environment, as parsing modifies it.
+        env = dict(os.environ)
+        with ThreadPoolExecutor(max_workers=min(len(existing_dirs), utils.available_cpus())) as executor:
+            greps = [executor.submit(self._grep_config_refs, app_dir, env) for app_dir in existing_dirs]
+            for app_dir, grep in zip(existing_dirs, greps, strict=True):
+                kconf = self._parse_app_kconfig(app_dir, app_kconfigs.get(app_dir), hwm)
+                self.current_app_dir = app_dir
+                self.check_no_undef_outside_kconfig(kconf, grep.result())
+
+    def _parse_app_kconfig(self, app_dir, app_kconfig_path, hwm):
+        """
+        Parse the Kconfig tree of a single application, from its entry Kconfig
+        (None if it has none).
+        """
         logging.info(f"Checking application: {app_dir}/")
 
-        # Detect Kconfig and parse appropriate tree
-        app_kconfig_path = app_path / filename
-        if app_kconfig_path.exists():
-            logging.debug(f"Using app Kconfig: {app_dir}/{filename}")
-            kconf = self.parse_kconfig(filename=str(app_kconfig_path), hwm=hwm)
-        else:
-            logging.debug("No app Kconfig, using Zephyr base")
-            kconf = self.parse_kconfig(filename=str(utils.ZEPHYR_BASE / "Kconfig.zephyr"), hwm=hwm)
+        # Parse the app tree if it has one
+        if app_kconfig_path is not None:
+            logging.debug(f"Using app Kconfig: {app_kconfig_path}")
+            return self.parse_kconfig(filename=app_kconfig_path, hwm=hwm)
 
-        # Execute check filtered by app_dir
-        self.current_app_dir = app_dir
-        self.check_no_undef_outside_kconfig(kconf)
+        logging.debug("No app Kconfig, using Zephyr base")
+        return self.parse_kconfig(filename=str(utils.ZEPHYR_BASE / "Kconfig.zephyr"), hwm=hwm)
 
     def _find_entry_kconfig(self, app_dir, filename):
         """Find entry Kconfig for an app (or fallback to Zephyr)."""
@@ -173,22 +378,25 @@ class KconfigCheck(ComplianceTest):
         except subprocess.CalledProcessError as ex:
             self.error(ex.output.decode("utf-8"))
 
-        modules_dir = utils.ZEPHYR_BASE / 'modules'
-        modules = [name for name in os.listdir(modules_dir) if os.path.exists(modules_dir / name / 'Kconfig')]
+        # The directory entries already tell which ones are directories, so
+        # only those need a stat() of their Kconfig
+        modules = []
+        with os.scandir(os.path.join(utils.ZEPHYR_BASE, 'modules')) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    kconfig = os.path.join(entry.path, 'Kconfig')
+                    if os.path.exists(kconfig):
+                        modules.append((entry.name, kconfig))
 
         with open(modules_file) as fp_module_file:
             content = fp_module_file.read()
 
         with open(modules_file, 'w') as fp_module_file:
-            for module in modules:
-                fp_module_file.write(
-                    "ZEPHYR_{}_KCONFIG = {}\n".format(
-                        re.sub('[^a-zA-Z0-9]', '_', module).upper(), str(modules_dir / module / 'Kconfig')
-                    )
-                )
+            for module, kconfig in modules:
+                fp_module_file.write(f"ZEPHYR_{module.translate(_SYM_CHAR_TABLE).upper()}_KCONFIG = {kconfig}\n")
             fp_module_file.write(content)
 
-    def get_kconfig_dts(self, kconfig_dts_file, settings_file):
+    def get_kconfig_dts(self, kconfig_dts_file, settings_roots):
         """
         Generate the Kconfig.dts using dts/bindings as the source.
 
@@ -201,15 +409,8 @@ class KconfigCheck(ComplianceTest):
         binding_paths = []
         binding_paths.append(os.path.join(utils.ZEPHYR_BASE, "dts", "bindings"))
 
-        if os.path.exists(settings_file):
-            with open(settings_file) as fp_setting_file:
-                content = fp_setting_file.read()
-
-            lines = content.strip().split('\n')
-            for line in lines:
-                if line.startswith('"DTS_ROOT":'):
-                    _, dts_root_path = line.split(":", 1)
-                    binding_paths.append(os.path.join(dts_root_path.strip('"'), "dts", "bindings"))
+        for dts_root_path in settings_roots["DTS_ROOT"]:
+            binding_paths.append(os.path.join(dts_root_path, "dts", "bindings"))
 
         cmd = [sys.executable, zephyr_drv_kconfig_path, '--kconfig-out', kconfig_dts_file, '--bindings-dirs']
         for binding_path in binding_paths:
@@ -243,7 +444,7 @@ class KconfigCheck(ComplianceTest):
                     fp_kconfig_v1_syms_file.write('\n\t' + kconfiglib.TYPE_TO_STR[s.type])
                     fp_kconfig_v1_syms_file.write('\n\n')
 
-    def get_v2_model(self, kconfig_dir):
+    def get_v2_model(self, kconfig_dir, settings_roots):
         """
         Get lists of v2 boards and SoCs and put them in a file that is parsed by
         Kconfig
@@ -262,97 +463,98 @@ class KconfigCheck(ComplianceTest):
         kconfig_boards_file = os.path.join(kconfig_dir, 'boards', 'Kconfig.boards')
         kconfig_defconfig_file = os.path.join(kconfig_dir, 'boards', 'Kconfig.defconfig')
 
-        # Read BOARD_ROOT from settings_file to include module boards
+        # Add the BOARD_ROOT and SOC_ROOT of modules to include their boards
         board_roots = [Path(utils.ZEPHYR_BASE)]
         soc_roots = [Path(utils.ZEPHYR_BASE)]
-        settings_file = os.path.join(kconfig_dir, 'settings_file.txt')
-
-        if os.path.exists(settings_file):
-            with open(settings_file) as f:
-                for line in f:
-                    if '"BOARD_ROOT":' in line:
-                        match = re.search(r'"BOARD_ROOT":"(.+?)"', line)
-                        if match:
-                            board_root = Path(match.group(1))
-                            if board_root not in board_roots:
-                                board_roots.append(board_root)
-                    elif '"SOC_ROOT":' in line:
-                        match = re.search(r'"SOC_ROOT":"(.+?)"', line)
-                        if match:
-                            soc_root = Path(match.group(1))
-                            if soc_root not in soc_roots:
-                                soc_roots.append(soc_root)
-
-        root_args = argparse.Namespace(
-            **{'board_roots': board_roots, 'soc_roots': soc_roots, 'board': None, 'board_dir': []}
-        )
+        for board_root in map(Path, settings_roots["BOARD_ROOT"]):
+            if board_root not in board_roots:
+                board_roots.append(board_root)
+        for soc_root in map(Path, settings_roots["SOC_ROOT"]):
+            if soc_root not in soc_roots:
+                soc_roots.append(soc_root)
+
+        root_args = argparse.Namespace(board_roots=board_roots, soc_roots=soc_roots, board=None, board_dir=[])
         v2_boards = list_boards.find_v2_boards(root_args)
 
+        # The three files are built in memory in a single pass over the boards,
+        # and each is written with a single write()
+        defconfig_lines = []
+        boards_lines = []
+        # Relative to KCONFIG_BINARY_DIR, as the files are generated in a
+        # temporary directory and then moved
+        kconfig_lines = ['osource "$(KCONFIG_BINARY_DIR)/boards/Kconfig.syms.v1"\n']
+        for board in v2_boards.values():
+            board_dir = Path(board.dir)
+            defconfig_lines.append('osource "' + (board_dir / 'Kconfig.defconfig').as_posix() + '"\n')
+
+            board_str = 'BOARD_' + board.name.translate(_SYM_CHAR_TABLE).upper()
+            boards_lines.append('config  ' + board_str + '\n\t bool\n')
+            for qualifier in list_boards.board_v2_qualifiers(board):
+                board_str = ('BOARD_' + board.name + '_' + qualifier.translate(_SYM_CHAR_TABLE)).upper()
+                boards_lines.append('config  ' + board_str + '\n\t bool\n')
+            boards_lines.append('source "' + (board_dir / ('Kconfig.' + board.name)).as_posix() + '"\n\n')
+
+            kconfig_lines.append('osource "' + (board_dir / 'Kconfig').as_posix() + '"\n')
+
         with open(kconfig_defconfig_file, 'w') as fp:
-            for board in v2_boards.values():
-                fp.write('osource "' + (Path(board.dir) / 'Kconfig.defconfig').as_posix() + '"\n')
+            fp.write("".join(defconfig_lines))
 
         with open(kconfig_boards_file, 'w') as fp:
-            for board in v2_boards.values():
-                board_str = 'BOARD_' + re.sub(r"[^a-zA-Z0-9_]", "_", board.name).upper()
-                fp.write('config  ' + board_str + '\n')
-                fp.write('\t bool\n')
-                for qualifier in list_boards.board_v2_qualifiers(board):
-                    board_str = ('BOARD_' + board.name + '_' + re.sub(r"[^a-zA-Z0-9_]", "_", qualifier)).upper()
-                    fp.write('config  ' + board_str + '\n')
-                    fp.write('\t bool\n')
-                fp.write('source "' + (Path(board.dir) / ('Kconfig.' + board.name)).as_posix() + '"\n\n')
+            fp.write("".join(boards_lines))
 
         with open(kconfig_file, 'w') as fp:
-            fp.write('osource "' + (Path(kconfig_dir) / 'boards' / 'Kconfig.syms.v1').as_posix() + '"\n')
-            for board in v2_boards.values():
-                fp.write('osource "' + (Path(board.dir) / 'Kconfig').as_posix() + '"\n')
+            fp.write("".join(kconfig_lines))
 
         kconfig_defconfig_file = os.path.join(kconfig_dir, 'soc', 'Kconfig.defconfig')
         kconfig_soc_file = os.path.join(kconfig_dir, 'soc', 'Kconfig.soc')
         kconfig_file = os.path.join(kconfig_dir, 'soc', 'Kconfig')
 
         # Use the soc_roots already extracted from settings_file above
-        root_args = argparse.Namespace(**{'soc_roots': soc_roots})
+        root_args = argparse.Namespace(soc_roots=soc_roots)
         v2_systems = list_hardware.find_v2_systems(root_args)
 
         # soc.folder es una lista, necesitamos aplanarla
         soc_folders = {folder for soc in v2_systems.get_socs() for folder in soc.folder}
+        soc_folders = [Path(folder) for folder in soc_folders]
         with open(kconfig_defconfig_file, 'w') as fp:
-            for folder in soc_folders:
-                fp.write('osource "' + (Path(folder) / 'Kconfig.defconfig').as_posix() + '"\n')
+            fp.write("".join('osource "' + (folder / 'Kconfig.defconfig').as_posix() + '"\n' for folder in soc_folders))
 
         with open(kconfig_soc_file, 'w') as fp:
-            for folder in soc_folders:
-                fp.write('source "' + (Path(folder) / 'Kconfig.soc').as_posix() + '"\n')
+            fp.write("".join('source "' + (folder / 'Kconfig.soc').as_posix() + '"\n' for folder in soc_folders))
 
         with open(kconfig_file, 'w') as fp:
-            for folder in soc_folders:
-                fp.write('source "' + (Path(folder) / 'Kconfig').as_posix() + '"\n')
+            fp.write("".join('source "' + (folder / 'Kconfig').as_posix() + '"\n' for folder in soc_folders))
 
         kconfig_file = os.path.join(kconfig_dir, 'arch', 'Kconfig')
 
-        root_args = argparse.Namespace(**{'arch_roots': [Path(utils.ZEPHYR_BASE)], 'arch': None})
+        root_args = argparse.Namespace(arch_roots=[Path(utils.ZEPHYR_BASE)], arch=None)
         v2_archs = list_hardware.find_v2_archs(root_args)
 
         with open(kconfig_file, 'w') as fp:
-            for arch in v2_archs['archs']:
-                fp.write('source "' + (Path(arch['path']) / 'Kconfig').as_posix() + '"\n')
+            fp.write(
+                "".join('source "' + (Path(arch['path']) / 'Kconfig').as_posix() + '"\n' for arch in v2_archs['archs'])
+            )
 
     def parse_kconfig(self, filename="Kconfig", hwm=None):
         """
         Returns a kconfiglib.Kconfig object for the Kconfig files. We reuse
         this object for all tests to avoid having to reparse for each test.
         """
+        key = (os.path.realpath(filename), hwm)
+        if key in self._kconf_cache:
+            return self._kconf_cache[key]
+
         # Put the Kconfiglib path first to make sure no local Kconfiglib version is
         # used
         kconfig_path = os.path.join(utils.ZEPHYR_BASE, "scripts", "kconfig")
         if not os.path.exists(kconfig_path):
             self.error(kconfig_path + " not found")
 
-        kconfiglib_dir = tempfile.mkdtemp(prefix="kconfiglib_")
+        kconfiglib_dir = self._kconfig_binary_dir()
 
-        sys.path.insert(0, kconfig_path)
+        # Only add it once, as the tree is parsed once per app
+        if kconfig_path not in sys.path:
+            sys.path.insert(0, kconfig_path)
         # Import globally so that e.g. kconfiglib.Symbol can be referenced in
         # tests
         global kconfiglib
@@ -377,23 +579,10 @@ class KconfigCheck(ComplianceTest):
         # versions that don't have the renaming
         os.environ["GENERATED_DTS_BOARD_CONF"] = "dummy"
 
-        # For multi repo support
-        self.get_modules(
-            os.path.join(kconfiglib_dir, "Kconfig.modules"), os.path.join(kconfiglib_dir, "settings_file.txt")
-        )
-        # For Kconfig.dts support
-        self.get_kconfig_dts(
-            os.path.join(kconfiglib_dir, "Kconfig.dts"), os.path.join(kconfiglib_dir, "settings_file.txt")
-        )
-
-        # To make compliance work with old hw model and HWMv2 simultaneously.
-        kconfiglib_boards_dir = os.path.join(kconfiglib_dir, 'boards')
-        os.makedirs(kconfiglib_boards_dir, exist_ok=True)
-        os.makedirs(os.path.join(kconfiglib_dir, 'soc'), exist_ok=True)
-        os.makedirs(os.path.join(kconfiglib_dir, 'arch'), exist_ok=True)
-
-        os.environ["BOARD_DIR"] = kconfiglib_boards_dir
-        self.get_v2_model(kconfiglib_dir)
+        os.environ["BOARD_DIR"] = os.path.join(kconfiglib_dir, 'boards')
+        # Also set by get_v2_model(), which does not run when the generated
+        # files are reused
+        os.environ['HWM_SCHEME'] = 'v2'
 
         # Tells Kconfiglib to generate warnings for all references to undefined
         # symbols within Kconfig files
@@ -404,13 +593,127 @@ class KconfigCheck(ComplianceTest):
             # Our filter in check_no_undef_within_kconfig() will decide which
             # warnings to report (only those from user code, not Zephyr internals).
             # Warnings are still available in kconf.warnings for filtering.
-            return kconfiglib.Kconfig(filename=filename, warn_to_stderr=False)
+            kconf = self._kconf_cache[key] = kconfiglib.Kconfig(filename=filename, warn_to_stderr=False)
+            return kconf
         except kconfiglib.KconfigError as e:
             self.failure(str(e))
             raise EndTest from e
-        finally:
-            # Clean up the temporary directory
-            shutil.rmtree(kconfiglib_dir)
+
+    def _kconfig_binary_dir(self):
+        """
+        Returns the directory holding the generated Kconfig.modules,
+        Kconfig.dts and board/SoC/arch files, generating them first if needed.
+
+        These files only depend on the workspace repositories, so they are
+        kept in .cache/kconfig/<fingerprint>/. They are generated in a
+        temporary directory next to it and moved into place once complete, so
+        that concurrent runs never see a partial directory. If they cannot be
+        kept between runs, they are generated once per run in a temporary
+        directory. run() removes the temporary directory.
+        """
+        if self._binary_dir is not None:
+            return self._binary_dir
+
+        cache_root = utils.GIT_TOP / ".cache" / "kconfig"
+        try:
+            cache_root.mkdir(parents=True, exist_ok=True)
+            self._temp_dir = tempfile.mkdtemp(prefix=".tmp-", dir=cache_root)
+        except OSError as e:
+            logging.warning(f"Could not create Kconfig cache in {cache_root}: {e}")
+            cache_root = None
+            self._temp_dir = tempfile.mkdtemp(prefix="kconfiglib_")
+
+        # The module list is part of the fingerprint, so it is generated first.
+        # It is cheap next to the other files.
+        settings_file = os.path.join(self._temp_dir, "settings_file.txt")
+        self.get_modules(os.path.join(self._temp_dir, "Kconfig.modules"), settings_file)
+        # Module roots, for both Kconfig.dts and the board/SoC lists
+        settings_roots = _read_settings_roots(settings_file)
+
+        fingerprint = None if cache_root is None else self._workspace_fingerprint(self._temp_dir, settings_roots)
+        if fingerprint is None:
+            self._generate_hw_files(self._temp_dir, settings_roots)
+            self._binary_dir = self._temp_dir
+            return self._binary_dir
+
+        binary_dir = cache_root / fingerprint
+        if (binary_dir / ".complete").exists():
+            logging.debug(f"Reusing generated Kconfig files in {binary_dir}")
+        else:
+            self._generate_hw_files(self._temp_dir, settings_roots)
+            # Only reuse the directory once everything has been generated
+            with open(os.path.join(self._temp_dir, ".complete"), "w"):
+                pass
+            try:
+                os.replace(self._temp_dir, binary_dir)
+            except OSError:
+                # A concurrent run got there first, or left an unfinished
+                # directory behind, which is then not used
+                if not (binary_dir / ".complete").exists():
+                    self._binary_dir = self._temp_dir
+                    return self._binary_dir
+
+        # Marks the directory as in use for _prune_kconfig_cache()
+        with contextlib.suppress(OSError):
+            os.utime(binary_dir)
+        _prune_kconfig_cache(cache_root, binary_dir)
+
+        self._binary_dir = str(binary_dir)
+        return self._binary_dir
+
+    def _generate_hw_files(self, kconfig_dir, settings_roots):
+        """
+        Generates Kconfig.dts and the board/SoC/arch files in kconfig_dir,
+        next to the Kconfig.modules already there.
+        """
+        # For Kconfig.dts support
+        self.get_kconfig_dts(os.path.join(kconfig_dir, "Kconfig.dts"), settings_roots)
+
+        # To make compliance work with old hw model and HWMv2 simultaneously.
+        os.makedirs(os.path.join(kconfig_dir, 'boards'), exist_ok=True)
+        os.makedirs(os.path.join(kconfig_dir, 'soc'), exist_ok=True)
+        os.makedirs(os.path.join(kconfig_dir, 'arch'), exist_ok=True)
+
+        self.get_v2_model(kconfig_dir, settings_roots)
+
+    def _workspace_fingerprint(self, modules_dir, settings_roots):
+        """
+        Returns a digest of what the generated files depend on:
+
+        - The module list, as generated by zephyr_module.py in modules_dir,
+          along with the ZEPHYR_MODULES environment variable and the west
+          configuration
+
+        - The HEAD commit and the modified and untracked files of Zephyr's
+          hardware, bindings, modules and scripts directories
+
+        - The same for the boards/, soc/ and dts/ directories of the
+          BOARD_ROOT, SOC_ROOT and DTS_ROOT of the modules
+
+        Returns None if Zephyr or a module root is not in a Git checkout, as
+        changes to it could then go unnoticed.
+        """
+        if not (utils.ZEPHYR_BASE / ".git").exists():
+            return None
+
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{utils.ZEPHYR_BASE}\0{self.no_modules}\0{os.environ.get('ZEPHYR_MODULES')}\0".encode())
+        h.update(_west_config(utils.ZEPHYR_BASE))
+
+        for name in sorted(os.listdir(modules_dir)):
+            with open(os.path.join(modules_dir, name), "rb") as f:
+                h.update(f"{name}\0".encode() + f.read() + b"\0")
+
+        trees = [(str(utils.ZEPHYR_BASE), ("arch", "boards", "soc", "dts", "modules", "scripts"))]
+        roots = {*settings_roots["BOARD_ROOT"], *settings_roots["SOC_ROOT"], *settings_roots["DTS_ROOT"]}
+        trees += [(root, ("boards", "soc", "dts")) for root in sorted(roots)]
+        for path, pathspecs in trees:
+            state = _tree_state(path, pathspecs)
+            if state is None:
+                return None
+            h.update(state)
+
+        return h.hexdigest()
 
     def get_logging_syms(self, kconf):
         # Returns a set() with the names of the Kconfig symbols generated with
@@ -418,7 +721,7 @@ class KconfigCheck(ComplianceTest):
         # include `CONFIG_` and for each module declared there is one symbol
         # per suffix created.
 
-        suffixes = [
+        suffixes = (
             "_LOG_LEVEL",
             "_LOG_LEVEL_DBG",
             "_LOG_LEVEL_ERR",
@@ -427,50 +730,51 @@ class KconfigCheck(ComplianceTest):
             "_LOG_LEVEL_OFF",
             "_LOG_LEVEL_INHERIT",
             "_LOG_LEVEL_DEFAULT",
-        ]
-
-        # Warning: Needs to work with both --perl-regexp and the 're' module.
-        regex = r"^\s*(?:module\s*=\s*)([A-Z0-9_]+)\s*(?:#|$)"
+        )
 
         # Grep samples/ and tests/ for symbol definitions
         grep_stdout = utils.git(
-            "grep", "-I", "-h", "--perl-regexp", regex, "--", ":samples", ":tests", cwd=utils.ZEPHYR_BASE
+            "grep", "-I", "-h", "--extended-regexp", _LOG_MOD_ERE, "--", ":samples", ":tests", cwd=utils.ZEPHYR_BASE
         )
 
-        names = re.findall(regex, grep_stdout, re.MULTILINE)
-
-        kconf_syms = []
-        for name in names:
-            for suffix in suffixes:
-                kconf_syms.append(f"{name}{suffix}")
+        # The same module is often declared in several places, so drop the
+        # duplicates before generating the symbol names
+        names = set(_LOG_MOD_RE.findall(grep_stdout))
 
-        return set(kconf_syms)
+        return {name + suffix for name in names for suffix in suffixes}
 
     def get_defined_syms(self, kconf):
-        # Returns a set() with the names of all defined Kconfig symbols (with no
-        # 'CONFIG_' prefix). This is complicated by samples and tests defining
-        # their own Kconfig trees. For those, just grep for 'config FOO' to find
-        # definitions. Doing it "properly" with Kconfiglib is still useful for
-        # the main tree, because some symbols are defined using preprocessor
-        # macros.
-
-        # Warning: Needs to work with both --perl-regexp and the 're' module.
-        # (?:...) is a non-capturing group.
-        regex = r"^\s*(?:menu)?config\s*([A-Z0-9_]+)\s*(?:#|$)"
+        # Returns a frozenset with the names of all defined Kconfig symbols
+        # (with no 'CONFIG_' prefix). This is complicated by samples and tests
+        # defining their own Kconfig trees. For those, just grep for
+        # 'config FOO' to find definitions. Doing it "properly" with Kconfiglib
+        # is still useful for the main tree, because some symbols are defined
+        # using preprocessor macros.
+        if kconf in self._defined_syms_cache:
+            return self._defined_syms_cache[kconf]
 
         # Grep samples/ and tests/ for symbol definitions
         grep_stdout = utils.git(
-            "grep", "-I", "-h", "--perl-regexp", regex, "--", ":samples", ":tests", cwd=utils.ZEPHYR_BASE
+            "grep", "-I", "-h", "--extended-regexp", _DEF_SYM_ERE, "--", ":samples", ":tests", cwd=utils.ZEPHYR_BASE
         )
 
-        # Generate combined list of configs and choices from the main Kconfig tree.
-        kconf_syms = kconf.unique_defined_syms + kconf.unique_choices
-
-        # Symbols from the main Kconfig tree + grepped definitions from samples
-        # and tests
-        return set([sym.name for sym in kconf_syms] + re.findall(regex, grep_stdout, re.MULTILINE)).union(
-            self.get_logging_syms(kconf)
-        )
+        # Symbols (configs and choices) from the main Kconfig tree + grepped
+        # definitions from samples and tests + logging template symbols, added
+        # to a single set without intermediate lists
+        defined_syms = {sym.name for sym in kconf.unique_defined_syms}
+        defined_syms.update(choice.name for choice in kconf.unique_choices)
+        defined_syms.update(_DEF_SYM_RE.findall(grep_stdout))
+        defined_syms.update(self.get_logging_syms(kconf))
+        defined_syms = self._defined_syms_cache[kconf] = frozenset(defined_syms)
+        return defined_syms
+
+    def get_nodes(self, kconf):
+        # Returns a list of all menu nodes in the Kconfig tree, in node_iter()
+        # order. Walking the menu tree is slow for big trees, so the checks
+        # share a single walk.
+        if kconf not in self._nodes_cache:
+            self._nodes_cache[kconf] = list(kconf.node_iter())
+        return self._nodes_cache[kconf]
 
     def check_top_menu_not_too_long(self, kconf):
         """
@@ -498,7 +802,7 @@ deliberately adding new entries, then bump the 'max_top_items' variable in
     def check_no_redefined_in_defconfig(self, kconf):
         # Checks that no symbols are (re)defined in defconfigs.
 
-        for node in kconf.node_iter():
+        for node in self.get_nodes(kconf):
             if "defconfig" in node.filename and (node.prompt or node.help):
                 name = node.item.name if node.item not in (kconfiglib.MENU, kconfiglib.COMMENT) else str(node)
                 self.failure(f"""
@@ -510,11 +814,7 @@ Options must not be defined in defconfig files.
     def check_no_enable_in_boolean_prompt(self, kconf):
         # Checks that boolean's prompt does not start with "Enable...".
 
-        for node in kconf.node_iter():
-            # skip Kconfig nodes not in-tree (will present an absolute path)
-            if os.path.isabs(node.filename):
-                continue
-
+        for node in self.get_nodes(kconf):
             # only process boolean symbols with a prompt
             if (
                 not isinstance(node.item, kconfiglib.Symbol)
@@ -524,7 +824,11 @@ Options must not be defined in defconfig files.
             ):
                 continue
 
-            if re.match(r"^[Ee]nable.*", node.prompt[0]):
+            # skip Kconfig nodes not in-tree (will present an absolute path)
+            if os.path.isabs(node.filename):
+                continue
+
+            if node.prompt[0].startswith(("Enable", "enable")):
                 self.failure(f"""
 Boolean option '{node.item.name}' prompt must not start with 'Enable...'. Please
 check Kconfig guidelines.
@@ -536,7 +840,7 @@ check Kconfig guidelines.
         # children in the Kconfig files
 
         bad_mconfs = []
-        for node in kconf.node_iter():
+        for node in self.get_nodes(kconf):
             # Avoid flagging empty regular menus and choices, in case people do
             # something with 'osource' (could happen for 'menuconfig' symbols
             # too, though it's less likely)
@@ -562,52 +866,23 @@ https://docs.zephyrproject.org/latest/build/kconfig/tips.html#menuconfig-symbols
         # Filter warnings to only include those from user's workspace
         filtered_warnings = []
 
-        # Zephyr internal directories to exclude (these are relative paths from ZEPHYR_BASE)
-        zephyr_internal_dirs = [
-            "arch/",
-            "boards/",
-            "doc/",
-            "drivers/",
-            "dts/",
-            "include/",
-            "kernel/",
-            "lib/",
-            "misc/",
-            "modules/",
-            "samples/",
-            "scripts/",
-            "share/",
-            "soc/",
-            "subsys/",
-            "tests/",
-        ]
-
         for warning in kconf.warnings:
             if "undefined symbol" not in warning:
                 continue
 
             # Only keep warnings that reference files in user's workspace (main_node, secondary_node)
             # or skip warnings from Zephyr internal directories
-            if any(user_dir in warning for user_dir in ["main_node/", "secondary_node/"]):
+            if "main_node/" in warning or "secondary_node/" in warning:
                 # This is from user code, keep it
                 filtered_warnings.append(warning)
                 continue
 
-            # Check if warning references any Zephyr internal directory
-            # Format: "- Referenced at <path>:<line>:"
-            is_zephyr_internal = False
-            for zephyr_dir in zephyr_internal_dirs:
-                if f"at {zephyr_dir}" in warning or f"at deps/zephyr/{zephyr_dir}" in warning:
-                    is_zephyr_internal = True
-                    break
-
             # Only add if it's NOT from Zephyr internals
-            if not is_zephyr_internal:
+            if not _ZEPHYR_INTERNAL_REF_RE.search(warning):
                 filtered_warnings.append(warning)
 
-        undef_ref_warnings = "\n\n\n".join(filtered_warnings)
-
-        if undef_ref_warnings:
+        if filtered_warnings:
+            undef_ref_warnings = "\n\n\n".join(filtered_warnings)
             self.failure(f"Undefined Kconfig symbols:\n\n {undef_ref_warnings}")
 
     def check_soc_name_sync(self, kconf):
@@ -617,50 +892,38 @@ https://docs.zephyrproject.org/latest/build/kconfig/tips.html#menuconfig-symbols
             sys.path.insert(0, zephyr_scripts_path)
         import list_hardware
 
-        root_args = argparse.Namespace(**{'soc_roots': [Path(utils.ZEPHYR_BASE)]})
+        root_args = argparse.Namespace(soc_roots=[Path(utils.ZEPHYR_BASE)])
         v2_systems = list_hardware.find_v2_systems(root_args)
 
         soc_names = {soc.name for soc in v2_systems.get_socs()}
 
-        soc_kconfig_names = set()
-        for node in kconf.node_iter():
-            if isinstance(node.item, kconfiglib.Symbol) and node.item.name == "SOC":
-                n = node.item
-                for d in n.defaults:
-                    soc_kconfig_names.add(d[0].name)
-
-        soc_name_warnings = []
-        for name in soc_names:
-            if name not in soc_kconfig_names:
-                soc_name_warnings.append(f"soc name: {name} not found in CONFIG_SOC defaults.")
-
-        if soc_name_warnings:
-            soc_name_warning_str = '\n'.join(soc_name_warnings)
+        soc_kconfig_names = {
+            d[0].name
+            for node in self.get_nodes(kconf)
+            if isinstance(node.item, kconfiglib.Symbol) and node.item.name == "SOC"
+            for d in node.item.defaults
+        }
+
+        # Sorted, so that the output does not depend on set ordering
+        missing = sorted(soc_names - soc_kconfig_names)
+        if missing:
+            soc_name_warning_str = '\n'.join(f"soc name: {name} not found in CONFIG_SOC defaults." for name in missing)
             self.failure(f'''
 Missing SoC names or CONFIG_SOC vs soc.yml out of sync:
 
 {soc_name_warning_str}
 ''')
 
-    def check_no_undef_outside_kconfig(self, kconf):
+    def _grep_config_refs(self, app_dir, env=None):
         """
-        Checks that there are no references to undefined Kconfig symbols
-        outside Kconfig files (any CONFIG_FOO where no FOO symbol exists)
+        Returns the git grep output for the CONFIG_* references in app_dir,
+        or in the entire repository (excluding deps/) if app_dir is None.
+        git runs in the environment env, by default os.environ.
         """
-        defined_syms = self.get_defined_syms(kconf)
-
-        # Maps each undefined symbol to a list <filename>:<linenr> strings
-        undef_to_locs = collections.defaultdict(list)
-
-        # Warning: Needs to work with both --perl-regexp and the 're' module
-        regex = r"\bCONFIG_[A-Z0-9_]+\b(?!\s*##|[$@{*])"
-
-        # Construct search arguments based on current_app_dir
-        if hasattr(self, 'current_app_dir') and self.current_app_dir is not None:
+        if app_dir is not None:
             # Mode: specific app directory
-            search_path = self.current_app_dir
-            logging.info(f"Searching CONFIG_* references in: {search_path}/")
-            search_args = [search_path]
+            logging.info(f"Searching CONFIG_* references in: {app_dir}/")
+            search_args = [app_dir]
         else:
             # Mode: entire repository (excluding deps/)
             logging.info("Searching CONFIG_* references in: entire repository (excluding deps/)")
@@ -669,35 +932,51 @@ Missing SoC names or CONFIG_SOC vs soc.yml out of sync:
         # Skip doc/releases and doc/security/vulnerabilities.rst, which often
         # reference removed symbols
         # Use ignore_non_zero=True because git grep returns 1 when no matches found
-        grep_stdout = utils.git(
+        # -o prints each match on its own line, so the symbols need no
+        # second regex pass here
+        return utils.git(
             "grep",
+            "--only-matching",
             "--line-number",
             "-I",
             "--null",
             "--perl-regexp",
-            regex,
+            _CONFIG_REF_RE.pattern,
             "--",
             *search_args,
             ":!/doc/releases",
             ":!/doc/security/vulnerabilities.rst",
             cwd=Path(utils.GIT_TOP),
             ignore_non_zero=True,
+            env=env,
         )
 
-        # splitlines() supports various line terminators
-        for grep_line in grep_stdout.splitlines():
-            path, lineno, line = grep_line.split("\0")
-
-            # Extract symbol references (might be more than one) within the
-            # line
-            for sym_name in re.findall(regex, line):
-                sym_name = sym_name[7:]  # Strip CONFIG_
-                if (
-                    sym_name not in defined_syms
-                    and sym_name not in self.UNDEF_KCONFIG_ALLOWLIST
-                    and not (sym_name.endswith("_MODULE") and sym_name[:-7] in defined_syms)
-                ):
-                    undef_to_locs[sym_name].append(f"{path}:{lineno}")
+    def check_no_undef_outside_kconfig(self, kconf, grep_stdout=None):
+        """
+        Checks that there are no references to undefined Kconfig symbols
+        outside Kconfig files (any CONFIG_FOO where no FOO symbol exists)
+
+        grep_stdout is the output of _grep_config_refs() for
+        current_app_dir, if it was already run.
+        """
+        defined_syms = self.get_defined_syms(kconf)
+
+        # Maps each undefined symbol to a list <filename>:<linenr> strings
+        undef_to_locs = collections.defaultdict(list)
+
+        if grep_stdout is None:
+            grep_stdout = self._grep_config_refs(getattr(self, 'current_app_dir', None))
+
+        allowlist = self.UNDEF_KCONFIG_ALLOWLIST
+
+        for path, lineno, sym_name in _GREP_REF_RE.findall(grep_stdout):
+            # Nearly all references are to defined symbols, so test that first
+            if sym_name in defined_syms or sym_name in allowlist:
+                continue
+            if sym_name.endswith("_MODULE") and sym_name[:-7] in defined_syms:
+                continue
+
+            undef_to_locs[sym_name].append(f"{path}:{lineno}")
 
         if not undef_to_locs:
             return
@@ -709,7 +988,7 @@ Missing SoC names or CONFIG_SOC vs soc.yml out of sync:
         #   CONFIG_ALSO_MISSING    arch/xtensa/core/fatal.c:273
         #   CONFIG_MISSING         arch/xtensa/core/fatal.c:264, subsys/fb/cfb.c:20
         undef_desc = "\n".join(
-            f"CONFIG_{sym_name:35} {', '.join(locs)}" for sym_name, locs in sorted(undef_to_locs.items())
+            f"CONFIG_{sym_name:35} {', '.join(undef_to_locs[sym_name])}" for sym_name in sorted(undef_to_locs)
         )
 
         self.failure(f"""
@@ -727,117 +1006,119 @@ flagged.
 
     # Many of these are symbols used as examples. Note that the list is sorted
     # alphabetically, and skips the CONFIG_ prefix.
-    UNDEF_KCONFIG_ALLOWLIST = {
-        "ALSO_MISSING",
-        "APP_LINK_WITH_",
-        "APP_LOG_LEVEL",  # Application log level is not detected correctly as
-        # the option is defined using a template, so it can't
-        # be grepped
-        "APP_LOG_LEVEL_DBG",
-        "ARMCLANG_STD_LIBC",  # The ARMCLANG_STD_LIBC is defined in the
-        # toolchain Kconfig which is sourced based on
-        # Zephyr toolchain variant and therefore not
-        # visible to compliance.
-        "BOARD_",  # Used as regex in scripts/utils/board_v1_to_v2.py
-        "BOOT_ENCRYPTION_KEY_FILE",  # Used in sysbuild
-        "BOOT_ENCRYPT_IMAGE",  # Used in sysbuild
-        "BINDESC_",  # Used in documentation as a prefix
-        "BOOT_UPGRADE_ONLY",  # Used in example adjusting MCUboot config, but
-        # symbol is defined in MCUboot itself.
-        "BOOT_SERIAL_BOOT_MODE",  # Used in (sysbuild-based) test/
-        # documentation
-        "BOOT_SERIAL_CDC_ACM",  # Used in (sysbuild-based) test
-        "BOOT_SERIAL_ENTRANCE_GPIO",  # Used in (sysbuild-based) test
-        "BOOT_SERIAL_IMG_GRP_HASH",  # Used in documentation
-        "BOOT_SHARE_DATA",  # Used in Kconfig text
-        "BOOT_SHARE_DATA_BOOTINFO",  # Used in (sysbuild-based) test
-        "BOOT_SHARE_BACKEND_RETENTION",  # Used in Kconfig text
-        "BOOT_SIGNATURE_KEY_FILE",  # MCUboot setting used by sysbuild
-        "BOOT_SIGNATURE_TYPE_ECDSA_P256",  # MCUboot setting used by sysbuild
-        "BOOT_SIGNATURE_TYPE_ED25519",  # MCUboot setting used by sysbuild
-        "BOOT_SIGNATURE_TYPE_NONE",  # MCUboot setting used by sysbuild
-        "BOOT_SIGNATURE_TYPE_RSA",  # MCUboot setting used by sysbuild
-        "BOOT_VALIDATE_SLOT0",  # Used in (sysbuild-based) test
-        "BOOT_WATCHDOG_FEED",  # Used in (sysbuild-based) test
-        "CDC_ACM_PORT_NAME_",
-        "CHRE",  # Optional module
-        "CHRE_LOG_LEVEL_DBG",  # Optional module
-        "CLOCK_STM32_SYSCLK_SRC_",
-        "CMU",
-        "COMPILER_RT_RTLIB",
-        "BT_6LOWPAN",  # Defined in Linux, mentioned in docs
-        "CMD_CACHE",  # Defined in U-Boot, mentioned in docs
-        "CRC",  # Used in TI CC13x2 / CC26x2 SDK comment
-        "DEEP_SLEEP",  # #defined by RV32M1 in ext/
-        "DESCRIPTION",
-        "ERR",
-        "ESP_DIF_LIBRARY",  # Referenced in CMake comment
-        "EXPERIMENTAL",
-        "FFT",  # Used as an example in cmake/extensions.cmake
-        "FLAG",  # Used as an example
-        "FOO",
-        "FOO_LOG_LEVEL",
-        "FOO_SETTING_1",
-        "FOO_SETTING_2",
-        "HEAP_MEM_POOL_ADD_SIZE_",  # Used as an option matching prefix
-        "LSM6DSO_INT_PIN",
-        "LIBGCC_RTLIB",
-        "LLVM_USE_LD",  # Both LLVM_USE_* are in cmake/toolchain/llvm/Kconfig
-        "LLVM_USE_LLD",  # which are only included if LLVM is selected but
-        # not other toolchains. Compliance check would complain,
-        # for example, if you are using GCC.
-        "MCUBOOT_LOG_LEVEL_WRN",  # Used in example adjusting MCUboot
-        # config,
-        "MCUBOOT_LOG_LEVEL_INF",
-        "MCUBOOT_DOWNGRADE_PREVENTION",  # but symbols are defined in MCUboot
-        # itself.
-        "MCUBOOT_ACTION_HOOKS",  # Used in (sysbuild-based) test
-        "MCUBOOT_CLEANUP_ARM_CORE",  # Used in (sysbuild-based) test
-        "MCUBOOT_SERIAL",  # Used in (sysbuild-based) test/
-        # documentation
-        "MCUMGR_GRP_EXAMPLE_OTHER_HOOK",  # Used in documentation
-        "MISSING",
-        "MODULES",
-        "MYFEATURE",
-        "MY_DRIVER_0",
-        "NORMAL_SLEEP",  # #defined by RV32M1 in ext/
-        "OPT",
-        "OPT_0",
-        "PEDO_THS_MIN",
-        "PSA_H",  # This is used in config-psa.h as guard for the header file
-        "REG1",
-        "REG2",
-        "RIMAGE_SIGNING_SCHEMA",  # Optional module
-        "LOG_BACKEND_MOCK_OUTPUT_DEFAULT",  # Referenced in tests/subsys/logging/log_syst
-        "LOG_BACKEND_MOCK_OUTPUT_SYST",  # Referenced in testcase.yaml of log_syst test
-        "SEL",
-        "SHIFT",
-        "SOC_SERIES_",  # Used as regex in scripts/utils/board_v1_to_v2.py
-        "SOC_WATCH",  # Issue 13749
-        "SOME_BOOL",
-        "SOME_INT",
-        "SOME_OTHER_BOOL",
-        "SOME_STRING",
-        "SRAM2",  # Referenced in a comment in samples/application_development
-        "STACK_SIZE",  # Used as an example in the Kconfig docs
-        "STD_CPP",  # Referenced in CMake comment
-        "TEST1",
-        "TOOLCHAIN_ARCMWDT_SUPPORTS_THREAD_LOCAL_STORAGE",  # The symbol is defined in the toolchain
-        # Kconfig which is sourced based on Zephyr
-        # toolchain variant and therefore not visible
-        # to compliance.
-        "TYPE_BOOLEAN",
-        "USB_CONSOLE",
-        "USE_STDC_",
-        "WHATEVER",
-        "EXTRA_FIRMWARE_DIR",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
-        "HUGETLBFS",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
-        "MODVERSIONS",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
-        "SECURITY_LOADPIN",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
-        "ZEPHYR_TRY_MASS_ERASE",  # MCUBoot setting described in sysbuild
-        # documentation
-        "ZTEST_FAIL_TEST_",  # regex in tests/ztest/fail/CMakeLists.txt
-        "SUIT_MPI_GENERATE",  # Used by nRF runners to program provisioning data, based on build configuration
-        "SUIT_MPI_APP_AREA_PATH",  # Used by nRF runners to program provisioning data, based on build configuration
-        "SUIT_MPI_RAD_AREA_PATH",  # Used by nRF runners to program provisioning data, based on build configuration
-    }
+    UNDEF_KCONFIG_ALLOWLIST = frozenset(
+        {
+            "ALSO_MISSING",
+            "APP_LINK_WITH_",
+            "APP_LOG_LEVEL",  # Application log level is not detected correctly as
+            # the option is defined using a template, so it can't
+            # be grepped
+            "APP_LOG_LEVEL_DBG",
+            "ARMCLANG_STD_LIBC",  # The ARMCLANG_STD_LIBC is defined in the
+            # toolchain Kconfig which is sourced based on
+            # Zephyr toolchain variant and therefore not
+            # visible to compliance.
+            "BOARD_",  # Used as regex in scripts/utils/board_v1_to_v2.py
+            "BOOT_ENCRYPTION_KEY_FILE",  # Used in sysbuild
+            "BOOT_ENCRYPT_IMAGE",  # Used in sysbuild
+            "BINDESC_",  # Used in documentation as a prefix
+            "BOOT_UPGRADE_ONLY",  # Used in example adjusting MCUboot config, but
+            # symbol is defined in MCUboot itself.
+            "BOOT_SERIAL_BOOT_MODE",  # Used in (sysbuild-based) test/
+            # documentation
+            "BOOT_SERIAL_CDC_ACM",  # Used in (sysbuild-based) test
+            "BOOT_SERIAL_ENTRANCE_GPIO",  # Used in (sysbuild-based) test
+            "BOOT_SERIAL_IMG_GRP_HASH",  # Used in documentation
+            "BOOT_SHARE_DATA",  # Used in Kconfig text
+            "BOOT_SHARE_DATA_BOOTINFO",  # Used in (sysbuild-based) test
+            "BOOT_SHARE_BACKEND_RETENTION",  # Used in Kconfig text
+            "BOOT_SIGNATURE_KEY_FILE",  # MCUboot setting used by sysbuild
+            "BOOT_SIGNATURE_TYPE_ECDSA_P256",  # MCUboot setting used by sysbuild
+            "BOOT_SIGNATURE_TYPE_ED25519",  # MCUboot setting used by sysbuild
+            "BOOT_SIGNATURE_TYPE_NONE",  # MCUboot setting used by sysbuild
+            "BOOT_SIGNATURE_TYPE_RSA",  # MCUboot setting used by sysbuild
+            "BOOT_VALIDATE_SLOT0",  # Used in (sysbuild-based) test
+            "BOOT_WATCHDOG_FEED",  # Used in (sysbuild-based) test
+            "CDC_ACM_PORT_NAME_",
+            "CHRE",  # Optional module
+            "CHRE_LOG_LEVEL_DBG",  # Optional module
+            "CLOCK_STM32_SYSCLK_SRC_",
+            "CMU",
+            "COMPILER_RT_RTLIB",
+            "BT_6LOWPAN",  # Defined in Linux, mentioned in docs
+            "CMD_CACHE",  # Defined in U-Boot, mentioned in docs
+            "CRC",  # Used in TI CC13x2 / CC26x2 SDK comment
+            "DEEP_SLEEP",  # #defined by RV32M1 in ext/
+            "DESCRIPTION",
+            "ERR",
+            "ESP_DIF_LIBRARY",  # Referenced in CMake comment
+            "EXPERIMENTAL",
+            "FFT",  # Used as an example in cmake/extensions.cmake
+            "FLAG",  # Used as an example
+            "FOO",
+            "FOO_LOG_LEVEL",
+            "FOO_SETTING_1",
+            "FOO_SETTING_2",
+            "HEAP_MEM_POOL_ADD_SIZE_",  # Used as an option matching prefix
+            "LSM6DSO_INT_PIN",
+            "LIBGCC_RTLIB",
+            "LLVM_USE_LD",  # Both LLVM_USE_* are in cmake/toolchain/llvm/Kconfig
+            "LLVM_USE_LLD",  # which are only included if LLVM is selected but
+            # not other toolchains. Compliance check would complain,
+            # for example, if you are using GCC.
+            "MCUBOOT_LOG_LEVEL_WRN",  # Used in example adjusting MCUboot
+            # config,
+            "MCUBOOT_LOG_LEVEL_INF",
+            "MCUBOOT_DOWNGRADE_PREVENTION",  # but symbols are defined in MCUboot
+            # itself.
+            "MCUBOOT_ACTION_HOOKS",  # Used in (sysbuild-based) test
+            "MCUBOOT_CLEANUP_ARM_CORE",  # Used in (sysbuild-based) test
+            "MCUBOOT_SERIAL",  # Used in (sysbuild-based) test/
+            # documentation
+            "MCUMGR_GRP_EXAMPLE_OTHER_HOOK",  # Used in documentation
+            "MISSING",
+            "MODULES",
+            "MYFEATURE",
+            "MY_DRIVER_0",
+            "NORMAL_SLEEP",  # #defined by RV32M1 in ext/
+            "OPT",
+            "OPT_0",
+            "PEDO_THS_MIN",
+            "PSA_H",  # This is used in config-psa.h as guard for the header file
+            "REG1",
+            "REG2",
+            "RIMAGE_SIGNING_SCHEMA",  # Optional module
+            "LOG_BACKEND_MOCK_OUTPUT_DEFAULT",  # Referenced in tests/subsys/logging/log_syst
+            "LOG_BACKEND_MOCK_OUTPUT_SYST",  # Referenced in testcase.yaml of log_syst test
+            "SEL",
+            "SHIFT",
+            "SOC_SERIES_",  # Used as regex in scripts/utils/board_v1_to_v2.py
+            "SOC_WATCH",  # Issue 13749
+            "SOME_BOOL",
+            "SOME_INT",
+            "SOME_OTHER_BOOL",
+            "SOME_STRING",
+            "SRAM2",  # Referenced in a comment in samples/application_development
+            "STACK_SIZE",  # Used as an example in the Kconfig docs
+            "STD_CPP",  # Referenced in CMake comment
+            "TEST1",
+            "TOOLCHAIN_ARCMWDT_SUPPORTS_THREAD_LOCAL_STORAGE",  # The symbol is defined in the toolchain
+            # Kconfig which is sourced based on Zephyr
+            # toolchain variant and therefore not visible
+            # to compliance.
+            "TYPE_BOOLEAN",
+            "USB_CONSOLE",
+            "USE_STDC_",
+            "WHATEVER",
+            "EXTRA_FIRMWARE_DIR",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
+            "HUGETLBFS",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
+            "MODVERSIONS",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
+            "SECURITY_LOADPIN",  # Linux, in boards/xtensa/intel_adsp_cavs25/doc
+            "ZEPHYR_TRY_MASS_ERASE",  # MCUBoot setting described in sysbuild
+            # documentation
+            "ZTEST_FAIL_TEST_",  # regex in tests/ztest/fail/CMakeLists.txt
+            "SUIT_MPI_GENERATE",  # Used by nRF runners to program provisioning data, based on build configuration
+            "SUIT_MPI_APP_AREA_PATH",  # Used by nRF runners to program provisioning data, based on build configuration
+            "SUIT_MPI_RAD_AREA_PATH",  # Used by nRF runners to program provisioning data, based on build configuration
+        }
+    )
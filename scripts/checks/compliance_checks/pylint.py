@@ -5,10 +5,18 @@ Pylint compliance check.
 Runs pylint on Python files with a limited set of checks enabled.
 """
 
-import json
+import collections
+import contextlib
+import io
 import logging
 import os
-import subprocess
+import sys
+from pathlib import Path
+
+import astroid
+import pylint
+from pylint.lint import Run
+from pylint.reporters import CollectingReporter
 
 from . import utils
 from .base import ComplianceTest
@@ -25,6 +33,7 @@ class PyLint(ComplianceTest):
     name = "Pylint"
     doc = "See https://www.pylint.org/ for more details"
     path_hint = "<git-top>"
+    multithreaded = True
 
     def run(self, mode="default"):
         """
@@ -43,7 +52,7 @@ class PyLint(ComplianceTest):
         if mode == "diff":
             # DIFF MODE: Analyze only modified Python files from git diff
             logging.info("Pylint: analyzing modified files from git diff")
-            files = utils.get_files(filter="d")
+            files = utils.get_files(filter="ACMR")
             py_files = utils.filter_python_files(files)
         else:
             # PATH/DEFAULT MODE: Scan directories for Python files
@@ -58,59 +67,99 @@ class PyLint(ComplianceTest):
             logging.info("Pylint: No Python files found to analyze")
             return
 
-        python_environment = os.environ.copy()
-        if "PYTHONPATH" in python_environment:
-            python_environment["PYTHONPATH"] = check_script_dir + ":" + python_environment["PYTHONPATH"]
-        else:
-            python_environment["PYTHONPATH"] = check_script_dir
+        # Let pylint find the additional checkers
+        if check_script_dir not in sys.path:
+            sys.path.insert(0, check_script_dir)
 
-        pylintcmd = [
-            "pylint",
-            "--output-format=json2",
-            "--rcfile=" + pylintrc,
-            "--load-plugins=argparse-checker",
-        ] + py_files
+        # Pylint's results are replayed from the cache if no file changed. They
+        # are not cached per file, as some of its checks look across modules.
+        try:
+            pylintrc_bytes = Path(pylintrc).read_bytes()
+        except FileNotFoundError:
+            pylintrc_bytes = None
+        # The Zephyr checkers loaded as plugins affect the results too
+        plugins = sorted((f.name, utils.file_digest(f)) for f in Path(check_script_dir).glob("*.py"))
+        cache_key = (pylint.__version__, astroid.__version__, pylintrc_bytes, plugins)
+        results = utils.cached_results(
+            "pylint", py_files, cache_key, lambda files: self._lint(files, pylintrc), whole_set=True
+        )
+        if results is None:
+            return
 
-        logging.debug(f"Running: {' '.join(pylintcmd)}")
+        for file in py_files:
+            for msg_id, line, column, msg, symbol in results[file]:
+                self._report_message(msg_id, file, line, column, msg, symbol)
 
+    def _lint(self, py_files, pylintrc):
+        """
+        Runs pylint on py_files. Returns the (message ID, line, column,
+        message, symbol) of their messages, by file, or None if it failed or
+        reported messages about something else than the files (which are
+        reported here, and not cached).
+        """
+        pylint_args = [
+            "--rcfile=" + pylintrc,
+            "--load-plugins=argparse-checker",
+        ]
+        if len(py_files) < utils.available_cpus():
+            # pylint spreads the files over its worker processes itself (jobs=0
+            # in pylintrc starts one per CPU). Don't start more workers than
+            # there are files, which matters in diff mode.
+            pylint_args.append(f"--jobs={len(py_files)}")
+        pylint_args += [os.path.join(utils.GIT_TOP, f) for f in py_files]
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Running: pylint {' '.join(pylint_args)}")
+
+        # Run pylint through its API rather than as a subprocess, which saves
+        # starting a second interpreter and the JSON round trip, the way
+        # YAMLLint uses yamllint. Its own output (e.g. on fatal errors) is
+        # captured to report it.
+        reporter = CollectingReporter()
+        output = io.StringIO()
         try:
-            subprocess.run(
-                pylintcmd,
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                cwd=utils.GIT_TOP,
-                env=python_environment,
-            )
-        except subprocess.CalledProcessError as ex:
-            output = ex.output.decode("utf-8")
-
-            # Try to parse JSON output
-            try:
-                result = json.loads(output)
-                messages = result.get('messages', [])
-            except (json.JSONDecodeError, KeyError) as e:
-                # If JSON parsing fails, output is likely an error message
-                logging.error(f"Failed to parse pylint JSON output: {e}")
-                logging.error(f"Raw output: {output[:500]}")  # First 500 chars
-                self.failure(f"Pylint execution failed:\n{output}")
-                return
-
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                status = Run(pylint_args, reporter=reporter, exit=False).linter.msg_status
+        except SystemExit as ex:
+            # Raised e.g. for invalid options, even with exit=False
+            status = ex.code
+        output = output.getvalue()
+
+        if not status:
+            return {}
+
+        messages = reporter.messages
+        if len(messages) == 0:
+            # If there are no specific messages add the whole output as a failure
+            self.failure(f"Pylint execution failed:\n{output}")
+            return None
+
+        # Files were passed as absolute paths
+        by_file = collections.defaultdict(list)
+        for m in messages:
+            if os.path.isabs(m.abspath):
+                by_file[os.path.relpath(m.abspath, utils.GIT_TOP)].append((m.msg_id, m.line, m.column, m.msg, m.symbol))
+
+        if sum(map(len, by_file.values())) != len(messages):
+            # Some messages (e.g. about the configuration) have no real path
             for m in messages:
-                severity = 'unknown'
-                if m['messageId'][0] in ('F', 'E'):
-                    severity = 'error'
-                elif m['messageId'][0] in ('W', 'C', 'R', 'I'):
-                    severity = 'warning'
-                self.fmtd_failure(
-                    severity,
-                    m['messageId'],
-                    m['path'],
-                    m['line'],
-                    col=str(m['column']),
-                    desc=m['message'] + f" ({m['symbol']})",
-                )
-
-            if len(messages) == 0:
-                # If there are no specific messages add the whole output as a failure
-                self.failure(output)
+                path = os.path.relpath(m.abspath, utils.GIT_TOP) if os.path.isabs(m.abspath) else m.path
+                self._report_message(m.msg_id, path, m.line, m.column, m.msg, m.symbol)
+            return None
+
+        return by_file
+
+    def _report_message(self, msg_id, path, line, column, msg, symbol):
+        severity = 'unknown'
+        if msg_id[0] in ('F', 'E'):
+            severity = 'error'
+        elif msg_id[0] in ('W', 'C', 'R', 'I'):
+            severity = 'warning'
+        self.fmtd_failure(
+            severity,
+            msg_id,
+            path,
+            line,
+            col=str(column),
+            desc=msg + f" ({symbol})",
+        )
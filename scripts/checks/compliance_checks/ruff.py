@@ -5,15 +5,22 @@ Ruff compliance check.
 Runs ruff check and ruff format on Python files.
 """
 
+import collections
 import json
 import logging
+import os
+import re
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 from . import utils
 from .base import ComplianceTest
 
 logger = logging.getLogger(__name__)
 
+# "+++ <file>" header of each file diff in ruff format --diff output
+_DIFF_HEADER_RE = re.compile(r"^\+\+\+ (.*)$", re.MULTILINE)
+
 
 class Ruff(ComplianceTest):
     """
@@ -35,7 +42,7 @@ class Ruff(ComplianceTest):
         if mode == "diff":
             # DIFF MODE: Analyze only modified Python files from git diff
             logging.info("Ruff: analyzing modified files from git diff")
-            files = utils.get_files(filter="d")
+            files = utils.get_files(filter="ACMR")
             py_files = utils.filter_python_files(files)
         else:
             # PATH/DEFAULT MODE: Scan directories for Python files
@@ -50,88 +57,195 @@ class Ruff(ComplianceTest):
             logging.info("Ruff: No Python files found to analyze")
             return
 
+        # What the results depend on besides the files themselves, for the
+        # result caches
+        cache_key = self._cache_key(utils.GIT_TOP / ".ruff.toml")
+
         # Part 1: Run ruff check (linter)
-        self._run_ruff_check(py_files)
+        self._run_ruff_check(py_files, cache_key)
 
         # Part 2: Run ruff format --diff (formatter)
-        self._run_ruff_format(py_files)
+        self._run_ruff_format(py_files, cache_key)
 
-    def _run_ruff_check(self, py_files):
+    def _cache_key(self, ruff_config):
+        """
+        Returns what ruff's results depend on besides the files themselves:
+        its version and configuration.
+        """
+        version = subprocess.run(["ruff", "--version"], check=True, capture_output=True).stdout
+        try:
+            config = ruff_config.read_bytes()
+        except FileNotFoundError:
+            config = None
+        return version, config
+
+    def _run_ruff_check(self, py_files, cache_key):
         """Run ruff check on Python files."""
         # Path to ruff configuration file
         ruff_config = utils.GIT_TOP / ".ruff.toml"
 
+        # Only files that changed since they were last checked are passed to
+        # ruff, the messages of the others are replayed from the cache
+        results = utils.cached_results(
+            "ruff-check", py_files, cache_key, lambda files: self._ruff_check(files, ruff_config)
+        )
+        if results is None:
+            return
+
+        for file in py_files:
+            for m in results[file]:
+                self._report_ruff_message(m)
+
+    def _ruff_check(self, py_files, ruff_config):
+        """
+        Runs ruff check on py_files. Returns its messages by file, or None if
+        it failed.
+        """
         ruffcmd = [
             "ruff",
             "check",
             "--config",
             str(ruff_config),
-            "--output-format=json",
+            "--output-format=json-lines",
         ] + py_files
 
-        logging.debug(f"Running: {' '.join(ruffcmd)}")
-
-        try:
-            subprocess.run(
-                ruffcmd,
-                check=True,
-                capture_output=True,
-                cwd=utils.GIT_TOP,
-            )
-        except subprocess.CalledProcessError as ex:
-            output = ex.output.decode("utf-8")
-
-            # Try to parse JSON output
-            try:
-                messages = json.loads(output)
-            except json.JSONDecodeError as e:
-                # If JSON parsing fails, output is likely an error message
-                logging.error(f"Failed to parse ruff JSON output: {e}")
-                logging.error(f"Raw output: {output[:500]}")  # First 500 chars
-                self.failure(f"Ruff check execution failed:\n{output}")
-                return
-
-            for m in messages:
-                self.fmtd_failure(
-                    "error",
-                    f'Ruff ({m.get("code")})',
-                    m.get("filename"),
-                    line=m.get("location", {}).get("row"),
-                    col=m.get("location", {}).get("column"),
-                    end_line=m.get("end_location", {}).get("row"),
-                    end_col=m.get("end_location", {}).get("column"),
-                    desc=f'{m.get("message")} - see {m.get("url")}',
-                )
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Running: {' '.join(ruffcmd)}")
 
-    def _run_ruff_format(self, py_files):
+        # Messages are read one per line as ruff outputs them, rather than
+        # parsing one JSON document holding them all once it exits. Other
+        # lines (e.g. warnings and errors on stderr) are kept for reporting
+        # failures.
+        messages = []
+        other_output = []
+        with subprocess.Popen(
+            ruffcmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            cwd=utils.GIT_TOP,
+        ) as proc:
+            for line in proc.stdout:
+                if line.startswith("{"):
+                    try:
+                        messages.append(utils.json_loads(line))
+                        continue
+                    except json.JSONDecodeError:
+                        pass
+                other_output.append(line)
+
+        if proc.returncode == 0:
+            return {}
+
+        if not messages:
+            output = "".join(other_output)
+            logging.error(f"Ruff check exited with {proc.returncode} without messages")
+            logging.error(f"Raw output: {output[:500]}")  # First 500 chars
+            self.failure(f"Ruff check execution failed:\n{output}")
+            return None
+
+        # ruff reports absolute paths
+        files_by_path = {}
+        for file in py_files:
+            path = utils.GIT_TOP / file
+            files_by_path[str(path)] = files_by_path[os.path.realpath(path)] = file
+
+        by_file = collections.defaultdict(list)
+        for m in messages:
+            file = files_by_path.get(m.get("filename"))
+            if file is None:
+                # Not attributable to one of the files, so not cacheable
+                self._report_ruff_message(m)
+            else:
+                by_file[file].append(m)
+        return by_file
+
+    def _report_ruff_message(self, m):
+        self.fmtd_failure(
+            "error",
+            f'Ruff ({m.get("code")})',
+            m.get("filename"),
+            line=m.get("location", {}).get("row"),
+            col=m.get("location", {}).get("column"),
+            end_line=m.get("end_location", {}).get("row"),
+            end_col=m.get("end_location", {}).get("column"),
+            desc=f'{m.get("message")} - see {m.get("url")}',
+        )
+
+    def _run_ruff_format(self, py_files, cache_key):
         """Run ruff format --diff to check formatting."""
         # Path to ruff configuration file
         ruff_config = utils.GIT_TOP / ".ruff.toml"
 
-        for file in py_files:
-            ruffcmd = [
-                "ruff",
-                "format",
-                "--config",
-                str(ruff_config),
-                "--force-exclude",
-                "--diff",
-                file,
-            ]
-
-            logging.debug(f"Running: {' '.join(ruffcmd)}")
+        # Whether each file needs formatting, cached like the ruff check
+        # results
+        results = utils.cached_results(
+            "ruff-format", py_files, cache_key, lambda files: self._ruff_format(files, ruff_config)
+        )
 
-            try:
-                subprocess.run(
-                    ruffcmd,
-                    check=True,
-                    capture_output=True,
-                    cwd=utils.GIT_TOP,
-                )
-            except subprocess.CalledProcessError:
+        for file in py_files:
+            if results[file]:
                 self.fmtd_failure(
                     "error",
                     "Ruff format",
                     file,
                     desc=f"File needs formatting. Run: ruff format {file}",
                 )
+
+    def _ruff_format(self, py_files, ruff_config):
+        """
+        Runs ruff format --diff on py_files. Returns True for the files that
+        need formatting, by file.
+        """
+        # A single ruff run formats the files in parallel. Files needing
+        # formatting are those with a diff.
+        result = subprocess.run(
+            self._ruff_format_cmd(ruff_config, py_files),
+            capture_output=True,
+            text=True,
+            cwd=utils.GIT_TOP,
+        )
+        if result.returncode in (0, 1):
+            diffed = {path.strip() for path in _DIFF_HEADER_RE.findall(result.stdout)}
+            if result.returncode == 0 or diffed and diffed <= set(py_files):
+                return {file: file in diffed for file in py_files}
+
+        # Some file could not be formatted (e.g. syntax error) or the diff was
+        # not understood. Run ruff on each file so that these are caught too.
+        logging.debug(f"ruff format exited with {result.returncode}, checking files one by one")
+        with ThreadPoolExecutor(max_workers=min(len(py_files), utils.available_cpus())) as executor:
+            return dict(
+                zip(
+                    py_files,
+                    executor.map(lambda file: self._file_needs_format(file, ruff_config), py_files),
+                    strict=True,
+                )
+            )
+
+    def _file_needs_format(self, file, ruff_config):
+        try:
+            subprocess.run(
+                self._ruff_format_cmd(ruff_config, [file]),
+                check=True,
+                capture_output=True,
+                cwd=utils.GIT_TOP,
+            )
+            return False
+        except subprocess.CalledProcessError:
+            return True
+
+    @staticmethod
+    def _ruff_format_cmd(ruff_config, files):
+        ruffcmd = [
+            "ruff",
+            "format",
+            "--config",
+            str(ruff_config),
+            "--force-exclude",
+            "--diff",
+            *files,
+        ]
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Running: {' '.join(ruffcmd)}")
+        return ruffcmd
@@ -4,55 +4,94 @@
 Utility functions for compliance checks.
 """
 
+import contextlib
+import functools
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
 import shlex
 import subprocess
 import sys
+import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
+# orjson parses large tool reports several times faster than the json module,
+# when it is installed. Its errors derive from json.JSONDecodeError.
+try:
+    import orjson as _json
+except ImportError:
+    import json as _json
+json_loads = _json.loads
+
 # Global variables (set by _main())
 WORKSPACE_BASE = None
 ZEPHYR_BASE = None
 GIT_TOP = None
 COMMIT_RANGE = None
-TARGET_PATHS = []
+TARGET_PATHS = ()
+CPUS = None
+
+# Values of the magic path hint strings (set by init_globals())
+PATH_HINTS = {}
 
 # Directories to ignore when scanning filesystem
-IGNORE_PATH_PARTS = {
-    '.git',
-    'build',
-    'deps',
-    'build_sca',
-    'buildsca',
-    '.cache',
-    'sca_logs',
-    'venv',
-    '.venv',
-    '.ruff_cache',
-}
-
-
-def init_globals(git_top, commit_range, target_paths, workspace_base, zephyr_base):
+IGNORE_PATH_PARTS = frozenset(
+    {
+        '.git',
+        'build',
+        'deps',
+        'build_sca',
+        'buildsca',
+        '.cache',
+        'sca_logs',
+        'venv',
+        '.venv',
+        '.ruff_cache',
+    }
+)
+
+# File mode of submodules in git diff --raw output
+_GITLINK_MODE = "160000"
+
+# Shebang of Python scripts, e.g. "#!/usr/bin/env python3"
+_PY_SHEBANG_RE = re.compile(rb'#!.*\bpython[0-9.]*\b')
+
+
+def init_globals(git_top, commit_range, target_paths, workspace_base, zephyr_base, cpus=None):
     """
     initialize global variables used by utility functions.
 
-    this must be called by the orchestrator before any checks run.
+    this must be called by the orchestrator before any checks run. 'cpus'
+    caps available_cpus(), for checks running next to each other.
     """
-    global GIT_TOP, COMMIT_RANGE, TARGET_PATHS, WORKSPACE_BASE, ZEPHYR_BASE
+    global GIT_TOP, COMMIT_RANGE, TARGET_PATHS, WORKSPACE_BASE, ZEPHYR_BASE, PATH_HINTS, CPUS
     GIT_TOP = git_top
     COMMIT_RANGE = commit_range
-    TARGET_PATHS = target_paths
+    # Hashable, so that it can key the cached file listings below
+    TARGET_PATHS = tuple(target_paths)
     WORKSPACE_BASE = workspace_base
     ZEPHYR_BASE = zephyr_base
-
-
-def resolve_path_hint(hint):
-    """Resolve magic path hint strings."""
-    hints = {
+    CPUS = cpus
+    # Files may have changed since an earlier run in the same process
+    file_contents.cache_clear()
+    for cache in (_files_from_paths, _files_by_ext, _get_files, _diff_name_status, _filter_python_files):
+        cache.cache_clear()
+    _app_roots.clear()
+    PATH_HINTS = {
         "<workspace-base>": WORKSPACE_BASE,
         "<zephyr-base>": ZEPHYR_BASE,
         "<git-top>": GIT_TOP,
     }
-    return hints.get(hint, hint)
+
+
+def resolve_path_hint(hint):
+    """Resolve magic path hint strings."""
+    return PATH_HINTS.get(hint, hint)
 
 
 def cmd2str(cmd):
@@ -69,11 +108,33 @@ def err(msg):
     sys.exit(f"{cmd} error: {msg}")
 
 
-def git(*args, cwd=None, ignore_non_zero=False):
-    """Helper for running a Git command. Returns the rstrip()ed stdout output."""
+def available_cpus():
+    """
+    Return the number of CPUs this process may run on, which can be less than
+    os.cpu_count() under taskset or in containers, or than that when the
+    orchestrator gave the check a share of them.
+    """
+    cpus = _affinity_cpus()
+    return min(cpus, CPUS) if CPUS else cpus
+
+
+@functools.cache
+def _affinity_cpus():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # Not available on all platforms
+        return os.cpu_count() or 1
+
+
+def git(*args, cwd=None, ignore_non_zero=False, env=None):
+    """
+    Helper for running a Git command. Returns the rstrip()ed stdout output.
+
+    'env' is the environment to run it in, by default os.environ.
+    """
     git_cmd = ("git",) + args
     try:
-        cp = subprocess.run(git_cmd, capture_output=True, cwd=cwd)
+        cp = subprocess.run(git_cmd, capture_output=True, cwd=cwd, env=env)
     except OSError as e:
         err(f"failed to run '{cmd2str(git_cmd)}': {e}")
 
@@ -90,107 +151,364 @@ def git(*args, cwd=None, ignore_non_zero=False):
     return cp.stdout.decode("utf-8").rstrip()
 
 
+# Contents cached by file_contents(), least recently used first, and the
+# bound on their total size
+_FILE_CONTENTS_MAX_BYTES = 64 * 1024 * 1024
+_file_contents = OrderedDict()
+_file_contents_bytes = 0
+_file_contents_lock = threading.Lock()
+
+
+def file_contents(path):
+    """
+    Return the contents of a file as bytes, or None if unreadable.
+
+    The result is cached, so a file hashed for cached_results() and then
+    linted by the same check is only read once. Worker processes forked
+    afterwards share what is cached. The cache is bounded by the total size
+    of the files rather than their number, as a few large files would
+    otherwise pin a lot of memory.
+    """
+    global _file_contents_bytes
+
+    with _file_contents_lock:
+        contents = _file_contents.get(path)
+        if contents is not None:
+            _file_contents.move_to_end(path)
+            return contents
+
+    try:
+        with open(path, "rb") as f:
+            contents = f.read()
+    except OSError:
+        return None
+
+    if len(contents) <= _FILE_CONTENTS_MAX_BYTES:
+        with _file_contents_lock:
+            if path not in _file_contents:
+                _file_contents[path] = contents
+                _file_contents_bytes += len(contents)
+            while _file_contents_bytes > _FILE_CONTENTS_MAX_BYTES:
+                _file_contents_bytes -= len(_file_contents.popitem(last=False)[1])
+    return contents
+
+
+def _file_contents_cache_clear():
+    global _file_contents_bytes
+
+    with _file_contents_lock:
+        _file_contents.clear()
+        _file_contents_bytes = 0
+
+
+# Same interface as the functools caches
+file_contents.cache_clear = _file_contents_cache_clear
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of a file's contents, or None if unreadable."""
+    contents = file_contents(path)
+    if contents is None:
+        return None
+    return hashlib.sha256(contents).hexdigest()
+
+
+def load_json_cache(path):
+    """
+    Return the value stored in the JSON cache file 'path', or None if there
+    is none or it is unreadable.
+
+    Caches are JSON rather than pickle, as they live in the work tree, which
+    may come from an untrusted pull request.
+    """
+    try:
+        with open(path, "rb") as f:
+            return json_loads(f.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logging.debug(f"Ignoring unreadable cache {path}: {e}")
+    return None
+
+
+def save_json_cache(path, obj):
+    """
+    Atomically write 'obj' to the JSON cache file 'path', creating its
+    directory if needed. Failures are only logged, as caches are optional.
+    """
+    tmp_path = None
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f"{path.name}.", suffix=".tmp", dir=path.parent)
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logging.warning(f"Could not write cache {path}: {e}")
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+
+
+def cached_results(tool, files, key, runner, whole_set=False):
+    """
+    Return the results of a tool for each of files, only running it on the
+    files whose results are not cached in .cache/<tool>/results.json.
+
+    Results are cached by file path and contents (sha256), under key, which
+    must identify everything else the results depend on (tool version,
+    configuration...). Results cached under another key are dropped.
+
+    Args:
+        tool: Name of the cache
+        files: List of file paths relative to GIT_TOP
+        key: Identification of the tool setup, with a stable repr()
+        runner: Called with the list of files to run the tool on. Returns a
+            dict mapping each of them to its JSON-serializable results, or
+            None if the tool failed, in which case nothing is cached. Tuples
+            come back from the cache as lists.
+        whole_set: True if the results of a file also depend on the other
+            files (e.g. cross-module checks). The tool then runs on all files
+            as soon as one of them changed.
+
+    Returns:
+        Dict mapping each file to its results, or None if runner failed
+    """
+    cache_path = GIT_TOP / ".cache" / tool / "results.json"
+    digests = {f: file_digest(GIT_TOP / f) for f in files}
+    if whole_set:
+        key = (key, sorted(digests.items()))
+    key = hashlib.sha256(repr(key).encode()).hexdigest()
+
+    cache = load_json_cache(cache_path)
+
+    # Maps each file to its [digest, results]
+    entries = {}
+    if isinstance(cache, dict) and cache.get("key") == key and isinstance(cache.get("entries"), dict):
+        entries = cache["entries"]
+
+    results = {}
+    misses = []
+    for f in files:
+        entry = entries.get(f)
+        if digests[f] is not None and isinstance(entry, list) and len(entry) == 2 and entry[0] == digests[f]:
+            results[f] = entry[1]
+        else:
+            misses.append(f)
+
+    logging.debug(f"{tool}: {len(results)} cached results, running on {len(misses)} files")
+    if not misses:
+        return results
+
+    fresh = runner(misses)
+    if fresh is None:
+        return None
+
+    for f in misses:
+        results[f] = fresh.get(f, [])
+        if digests[f] is not None:
+            entries[f] = [digests[f], results[f]]
+
+    save_json_cache(cache_path, {"key": key, "entries": entries})
+
+    return results
+
+
 def files_from_paths():
     """
     Expand TARGET_PATHS into a list of files (relative to GIT_TOP).
 
-    Scans directories recursively and collects all files, excluding
-    paths that contain parts in IGNORE_PATH_PARTS.
+    Scans directories recursively and collects all files. Directories
+    named in IGNORE_PATH_PARTS are not scanned, and target paths inside one
+    are skipped.
+
+    The result is cached, so several checks can ask for it without
+    walking the filesystem again.
 
     Returns:
         Sorted list of file paths relative to GIT_TOP
     """
-    root = Path(GIT_TOP).resolve()
+    return list(_files_from_paths(GIT_TOP, TARGET_PATHS))
+
+
+@functools.cache
+def _files_from_paths(git_top, target_paths):
+    root = Path(git_top).resolve()
+    root_prefix = os.path.join(root, '')
     out = set()
 
-    for p in TARGET_PATHS:
+    def add(path):
+        out.add(path[len(root_prefix) :] if path.startswith(root_prefix) else path)
+
+    for p in target_paths:
         pp = Path(p)
         abs_p = (root / pp).resolve() if not pp.is_absolute() else pp.resolve()
+        if not IGNORE_PATH_PARTS.isdisjoint(abs_p.parts):
+            continue
 
         if abs_p.is_dir():
-            # Recursively scan directory
-            for f in abs_p.rglob('*'):
-                if not f.is_file():
-                    continue
-                # Skip files in ignored directories
-                if any(part in IGNORE_PATH_PARTS for part in f.parts):
-                    continue
+            # Recursively scan directory, without descending into ignored
+            # directories. DirEntry caches the file type from readdir(), which
+            # saves a stat() per entry.
+            dirs = [str(abs_p)]
+            while dirs:
                 try:
-                    out.add(str(f.relative_to(root)))
-                except ValueError:
-                    out.add(str(f))
+                    it = os.scandir(dirs.pop())
+                except OSError:
+                    # Unreadable directory, which rglob() skipped too
+                    continue
+                with it:
+                    for entry in it:
+                        if entry.name in IGNORE_PATH_PARTS:
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(entry.path)
+                        elif entry.is_file():
+                            add(entry.path)
         elif abs_p.is_file():
             # Single file
-            if any(part in IGNORE_PATH_PARTS for part in abs_p.parts):
-                continue
-            try:
-                out.add(str(abs_p.relative_to(root)))
-            except ValueError:
-                out.add(str(abs_p))
+            add(str(abs_p))
+
+    return tuple(sorted(out))
+
+
+def files_with_ext(exts):
+    """
+    Return the files_from_paths() files whose extension (without the dot)
+    is in 'exts', keeping the sorted order.
+    """
+    buckets = _files_by_ext(GIT_TOP, TARGET_PATHS)
+    return list(heapq.merge(*(buckets.get(ext, ()) for ext in exts)))
 
-    return sorted(out)
+
+@functools.cache
+def _files_by_ext(git_top, target_paths):
+    # Bucket the listing by extension once, so each check only goes
+    # through the files it is interested in
+    buckets = {}
+    for f in _files_from_paths(git_top, target_paths):
+        _, dot, ext = f.rpartition(".")
+        if dot:
+            buckets.setdefault(ext, []).append(f)
+    return buckets
 
 
 def get_files(filter=None, paths=None):
     """Get modified files from git diff."""
-    filter_arg = (f"--diff-filter={filter}",) if filter else ()
-    paths_arg = ("--", *paths) if paths else ()
-    out = git("diff", "--name-only", *filter_arg, COMMIT_RANGE, *paths_arg)
-    files = out.splitlines()
-    for file in list(files):
-        if not (GIT_TOP / file).exists():
-            # Drop submodule directories from the list.
-            files.remove(file)
-    return files
+    return list(_get_files(COMMIT_RANGE, filter, tuple(paths) if paths else None))
+
+
+@functools.cache
+def _get_files(commit_range, filter, paths):
+    # Apply --diff-filter semantics to the cached listing rather than running
+    # git again for each filter
+    include = {c for c in filter or "" if c.isupper()}
+    exclude = {c.upper() for c in filter or "" if c.islower()}
+    return tuple(
+        f
+        for status, f in _diff_name_status(commit_range, paths)
+        if (not include or status in include) and status not in exclude
+    )
+
+
+@functools.cache
+def _diff_name_status(commit_range, paths=None):
+    """
+    Return (status, path) pairs for all files changed in 'commit_range',
+    optionally limited to 'paths'. Submodules are left out.
+
+    This is the single git diff that the get_files() listings are derived
+    from.
+    """
+    pathspec = ("--", *paths) if paths else ()
+    # -z keeps file names verbatim instead of quoting unusual characters.
+    # --raw gives the file modes, to tell submodules apart without looking at
+    # the working tree.
+    fields = iter(git("diff", "--raw", "-z", commit_range, *pathspec).split("\0"))
+    out = []
+    for info in fields:
+        if not info:
+            break
+        old_mode, new_mode, _, _, status = info.lstrip(":").split()
+        path = next(fields)
+        if status[0] in "RC":
+            # Renames and copies list the source, then the destination
+            path = next(fields)
+        if _GITLINK_MODE not in (old_mode, new_mode):
+            out.append((status[0], path))
+    return tuple(out)
 
 
 def filter_python_files(files):
     """
     Filter Python files from a list of filenames.
 
-    Uses python-magic to detect Python scripts even without .py extension
+    Detects Python scripts even without .py extension from their shebang
     (e.g., scripts with #!/usr/bin/env python3).
 
+    The result is cached, so several checks can ask for it without reading
+    the files again.
+
     Args:
         files: List of file paths relative to GIT_TOP
 
     Returns:
         List of Python file paths
     """
-    try:
-        import magic
-    except ImportError:
-        # Fallback: only check .py extension if magic is not available
-        return [f for f in files if f.endswith('.py')]
+    return list(_filter_python_files(GIT_TOP, tuple(files)))
+
 
+@functools.cache
+def _filter_python_files(git_top, files):
     py_files = []
     for fname in files:
-        full_path = GIT_TOP / fname
-        if not full_path.exists():
-            continue
+        full_path = git_top / fname
 
-        # Check extension or mime type
+        # Check extension or shebang
         if fname.endswith('.py'):
-            py_files.append(fname)
+            if full_path.exists():
+                py_files.append(fname)
         else:
             try:
-                mime = magic.from_file(str(full_path), mime=True)
-                if mime == "text/x-python":
-                    py_files.append(fname)
-            except Exception:
-                # If magic fails, skip this file
+                with open(full_path, 'rb') as f:
+                    head = f.read(128)
+            except OSError:
+                # Deleted file, directory, ...
                 continue
+            if _PY_SHEBANG_RE.match(head):
+                py_files.append(fname)
 
-    return py_files
+    return tuple(py_files)
 
 
 def find_zephyr_app_root(rel_path):
-    p = (GIT_TOP / rel_path).resolve()
-    d = p if p.is_dir() else p.parent
-
-    while True:
-        if (d / "prj.conf").is_file():
-            return d
-        if d == GIT_TOP:
-            return None
-        d = d.parent
+    p = os.path.realpath(GIT_TOP / rel_path)
+    return _app_root_for_dir(p if os.path.isdir(p) else os.path.dirname(p), str(GIT_TOP))
+
+
+# App root of each directory looked up by _app_root_for_dir(), keyed by
+# (git_top, directory)
+_app_roots = {}
+
+
+def _app_root_for_dir(d, git_top):
+    # Files are mostly looked up app by app, so the result is cached for each
+    # directory on the way up. That saves checking the same prj.conf files
+    # again.
+    visited = []
+    while (git_top, d) not in _app_roots:
+        visited.append(d)
+        if os.path.isfile(os.path.join(d, "prj.conf")):
+            root = Path(d)
+            break
+        parent = os.path.dirname(d)
+        if d in (git_top, parent):
+            root = None
+            break
+        d = parent
+    else:
+        root = _app_roots[git_top, d]
+
+    for v in visited:
+        _app_roots[git_top, v] = root
+    return root
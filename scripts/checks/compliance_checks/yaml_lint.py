@@ -5,13 +5,18 @@ YAMLLint compliance check.
 Checks YAML files for syntax and style issues using yamllint.
 """
 
-from pathlib import Path
+import functools
+from concurrent.futures import ProcessPoolExecutor
 
+import yamllint
 from yamllint import config, linter
 
 from . import utils
 from .base import ComplianceTest
 
+# Number of files each worker process lints at a time
+_CHUNKSIZE = 8
+
 
 class YAMLLint(ComplianceTest):
     """
@@ -21,6 +26,7 @@ class YAMLLint(ComplianceTest):
     name = "YAMLLint"
     doc = "Check YAML files with YAMLLint."
     path_hint = "<git-top>"
+    multithreaded = True
 
     def run(self, mode="default"):
         """
@@ -39,21 +45,72 @@ class YAMLLint(ComplianceTest):
             # DIFF MODE: Use git diff
             files = utils.get_files(filter="d")
 
-        for file in files:
-            if Path(file).suffix not in ['.yaml', '.yml']:
-                continue
+        yaml_files = [file for file in files if file.endswith(('.yaml', '.yml'))]
+
+        # Only files that changed since they were last checked are linted,
+        # the problems of the others are replayed from the cache
+        try:
+            cache_key = (yamllint.__version__, config_file.read_bytes())
+        except FileNotFoundError:
+            cache_key = (yamllint.__version__, None)
+        results = utils.cached_results("yamllint", yaml_files, cache_key, lambda files: self._lint(files, config_file))
+
+        for file in yaml_files:
+            for rule, line, column, desc in results[file]:
+                self.fmtd_failure('warning', f'YAMLLint ({rule})', file, line, col=column, desc=desc)
+
+    def _lint(self, files, config_file):
+        """
+        Lints files. Returns the (rule, line, column, description) of their
+        problems, by file.
+        """
+        lint = functools.partial(_lint_file, utils.GIT_TOP, config_file)
+        if len(files) <= _CHUNKSIZE:
+            return {file: lint(file) for file in files}
+
+        # yamllint is pure Python, so lint the files in several processes
+        # rather than threads
+        workers = min(utils.available_cpus(), -(-len(files) // _CHUNKSIZE))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(files, executor.map(lint, files, chunksize=_CHUNKSIZE), strict=True))
+
+
+def _lint_file(git_top, config_file, file):
+    """
+    Lints a file. Returns the (rule, line, column, description) of its
+    problems. Runs in worker processes.
+    """
+    # Read the file in one go and let yamllint decode it, like its command
+    # line does. It was usually read already to look up the results cache.
+    path = git_top / file
+    content = utils.file_contents(path)
+    if content is None:
+        # Unreadable, let the error be reported
+        content = path.read_bytes()
+    return [(p.rule, p.line, p.column, p.desc) for p in linter.run(content, _config_for(config_file, file))]
+
+
+def _config_for(config_file, file):
+    # Returns the yamllint configuration for file
+    if file.startswith(".github/"):
+        return _make_config(config_file, "workflow")
+    if file == ".codecov.yml":
+        return _make_config(config_file, "codecov")
+    return _make_config(config_file, None)
+
 
-            yaml_config = config.YamlLintConfig(file=config_file)
+@functools.cache
+def _make_config(config_file, kind):
+    # The configuration is parsed once per kind of file and process rather
+    # than once per file
+    yaml_config = config.YamlLintConfig(file=config_file)
 
-            # Tweak rules for specific files
-            if file.startswith(".github/"):
-                # Workflow files have different rules
-                yaml_config.rules["line-length"] = False
-                yaml_config.rules["truthy"]["allowed-values"].extend(['on', 'off'])
-            elif file == ".codecov.yml":
-                yaml_config.rules["truthy"]["allowed-values"].extend(['yes', 'no'])
+    # Tweak rules for specific files
+    if kind == "workflow":
+        # Workflow files have different rules
+        yaml_config.rules["line-length"] = False
+        yaml_config.rules["truthy"]["allowed-values"].extend(['on', 'off'])
+    elif kind == "codecov":
+        yaml_config.rules["truthy"]["allowed-values"].extend(['yes', 'no'])
 
-            full_path = utils.GIT_TOP / file
-            with open(full_path, encoding="utf-8") as fp:
-                for p in linter.run(fp, yaml_config):
-                    self.fmtd_failure('warning', f'YAMLLint ({p.rule})', file, p.line, col=p.column, desc=p.desc)
+    return yaml_config